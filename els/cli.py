@@ -6,15 +6,19 @@ import logging
 import os
 import sys
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Optional, Union
+from typing import Any, Optional, Union
 
 import pandas as pd
 import ruamel.yaml as yaml
 import typer
 
 import els.core as el
+import els.flow as ef
 import els.io.base as eio
-from els.config import Config
+import els.io.cache as source_cache
+import els.io.schemas as schemas
+from els.config import Config, Execution, ExecutionBackend, to_bytes
+from els.manifest import MANIFEST_NAME, Manifest
 from els.path import (
     CONFIG_FILE_EXT,
     ConfigPath,
@@ -25,9 +29,6 @@ from els.path import (
     plant_tree,
 )
 
-if TYPE_CHECKING:
-    import els.flow as ef
-
 # from pygments import highlight
 # from pygments.lexers import YamlLexer
 # from pygments.formatters import TerminalFormatter
@@ -55,17 +56,35 @@ def get_path(path: Optional[str] = None) -> Path:
     return ca_path
 
 
+def get_root_dir(path: Path) -> Path:
+    root = get_root_inheritance(str(path))[-1].absolute()
+    return root if root.is_dir() else root.parent
+
+
 class TaskFlow:
     def __init__(
         self,
         config_like: Optional[Union[str, Config]] = None,
         force_pandas_target: bool = False,
         nrows: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        backend: Optional[ExecutionBackend] = None,
+        incremental: bool = False,
+        refresh_schema: bool = False,
     ):
         self.config_like = config_like
         self.force_pandas_target = force_pandas_target
         self.nrows = nrows
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.execution = Execution()
+        # where the root config is, holding the source cache and manifest
+        self.root_dir = Path().absolute()
+        self.incremental = incremental
+        self.manifest: Optional[Manifest] = None
+        self.refresh_schema = refresh_schema
         self.taskflow = self.build()
+        self.executor: Optional[ef.FlowExecutor] = None
 
     def __enter__(self) -> TaskFlow:
         return self
@@ -77,6 +96,7 @@ class TaskFlow:
         start_logging()
         if isinstance(self.config_like, str):
             path = get_path(self.config_like)
+            self.root_dir = get_root_dir(path)
             tree = plant_tree(path)
         else:
             path = get_path("./__dynamic__.els.yml")
@@ -91,26 +111,70 @@ class TaskFlow:
         if self.nrows:
             tree.set_nrows(self.nrows)
         if tree:
-            return tree.get_ingest_taskflow()
+            # execution is only read from the root config
+            execution = tree.config.execution or Execution()
+            self.execution = execution.override(self.n_jobs, self.backend)
+            if self.incremental:
+                self.manifest = Manifest(self.root_dir / MANIFEST_NAME)
+            return tree.get_ingest_taskflow(self.execution, self.manifest)
         else:
             raise Exception("TaskFlow not built")
 
     def cleanup(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            logging.info(f"Executor: {self.executor.summary}")
+        logging.info(f"Containers: {el.df_containers.summary}")
+        self.log_reads()
         for container in el.df_containers.values():
             if isinstance(container, eio.ContainerWriterABC):
                 container.write()
             container.close()
         el.df_containers.clear()
-
-        # just in case files still open
-        for file in el.io_files.values():
-            file.close()
-        el.io_files.clear()
+        schemas.close_registry()
+        # all written: the sources loaded are not loaded again
+        if self.manifest is not None:
+            self.manifest.record(e.config for e in self.taskflow.executes if e.loaded)
+            self.manifest.save()
+        eio.memory_limit = None
+        el.set_cache_limit(None)
+        if source_cache.directory is not None:
+            logging.info(
+                f"Source cache: {source_cache.hits} hits, {source_cache.misses} misses"
+            )
+            source_cache.directory = None
+
+    # each table is read once, unless released and needed again
+    @staticmethod
+    def log_reads() -> None:
+        reads = eio.table_reads
+        if reads:
+            logging.info(f"Reads: {sum(reads.values())} reads of {len(reads)} tables")
+        for (url, table), count in reads.items():
+            if count > 1:
+                logging.info(f"Reads: {url} {table} read {count} times")
+        reads.clear()
 
     def display_tree(self) -> None:
         self.taskflow.display_tree()
 
     def execute(self) -> None:
+        # one executor for the run, shut down on cleanup
+        if self.executor is None:
+            self.executor = ef.FlowExecutor(self.taskflow.max_jobs)
+        self.taskflow.executor = self.executor
+        eio.memory_limit = self.execution.memory_limit_bytes
+        el.set_cache_limit(self.execution.cache_limit_bytes)
+        if self.execution.source_cache:
+            source_cache.directory = source_cache.cache_dir(self.root_dir)
+            source_cache.max_bytes = (
+                self.execution.source_cache_limit_bytes
+                or source_cache.DEFAULT_MAX_BYTES
+            )
+        if self.execution.schema_registry:
+            schemas.open_registry(
+                self.root_dir / schemas.REGISTRY_NAME, self.refresh_schema
+            )
         self.taskflow.execute()
 
 
@@ -278,6 +342,13 @@ def clean_none_path(
     return path
 
 
+# when commands are called as functions, unset options are typer.models.OptionInfo
+def clean_none_option(option: Any) -> Any:
+    if isinstance(option, typer.models.OptionInfo):
+        return option.default
+    return option
+
+
 @app.command()
 def preview(
     path: Optional[str] = typer.Argument(None),
@@ -311,11 +382,38 @@ def preview(
 
 
 @app.command()
-def execute(path: Optional[str] = typer.Argument(None)) -> None:
+def execute(
+    path: Optional[str] = typer.Argument(None),
+    jobs: Optional[int] = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        help="Worker count, -1 for all cpus, overrides the root execution config",
+    ),
+    backend: Optional[ExecutionBackend] = typer.Option(
+        None, help="Worker backend, overrides the root execution config"
+    ),
+    incremental: bool = typer.Option(
+        False, help="Only load the sources changed since the last incremental run"
+    ),
+    refresh_schema: bool = typer.Option(
+        False, help="Probe the target schemas again rather than using the registry"
+    ),
+) -> None:
     if isinstance(path, str):
         path = clean_none_path(path)
+    jobs = clean_none_option(jobs)
+    backend = clean_none_option(backend)
+    incremental = clean_none_option(incremental)
+    refresh_schema = clean_none_option(refresh_schema)
     # TODO, fix typing: sometimes path is a config object (at least in tests)
-    with TaskFlow(path) as taskflow:
+    with TaskFlow(
+        path,
+        n_jobs=jobs,
+        backend=backend,
+        incremental=incremental,
+        refresh_schema=refresh_schema,
+    ) as taskflow:
         taskflow.execute()
 
     if el.default_target and not isinstance(path, Config):
@@ -431,6 +529,27 @@ def new(
     typer.echo("Done!")
 
 
+cache_app = typer.Typer(help="Manage the cache of parsed source files.")
+app.add_typer(cache_app, name="cache")
+
+
+@cache_app.command("prune")
+def cache_prune(
+    path: Optional[str] = typer.Argument(None),
+    max_size: str = typer.Option(
+        "0", help="Size to prune the cache down to (e.g. 500MB), 0 to empty it"
+    ),
+) -> None:
+    path = clean_none_path(path)
+    cache_dir = source_cache.cache_dir(get_root_dir(get_path(path)))
+    max_bytes = to_bytes(max_size) or 0
+    if cache_dir.is_dir():
+        removed, removed_bytes = source_cache.prune(cache_dir, max_bytes)
+    else:
+        removed, removed_bytes = 0, 0
+    typer.echo(f"Removed {removed} entries ({removed_bytes} bytes) from {cache_dir}")
+
+
 @app.command()
 def root() -> None:
     root = get_root_inheritance()
@@ -8,7 +8,7 @@ from abc import ABC, abstractmethod
 from collections.abc import Sequence
 from enum import Enum
 from functools import cached_property
-from typing import Any, Literal, Optional, Union
+from typing import Any, ClassVar, Literal, Optional, Union
 from urllib.parse import urlparse
 
 import duckdb
@@ -74,6 +74,9 @@ class TransformABC(BaseModel, ABC, extra="forbid"):
     #     extra="forbid",
     #     json_schema_extra={"oneOf": [{"required": ["melt"]}, {"required": ["stack"]}]},
     # )
+    # transforms of each row on its own can be applied chunk by chunk
+    row_wise: ClassVar[bool] = False
+
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
         self._executed = False
@@ -187,6 +190,7 @@ class AsTypeTransform(TransformABC):
         extra="allow",
         json_schema_extra=fix_additional_properties,
     )
+    row_wise = True
 
     additionalProperties: Optional[str] = None
 
@@ -199,6 +203,7 @@ class AddColumnsTransform(TransformABC):
         extra="allow",
         json_schema_extra=fix_additional_properties,
     )
+    row_wise = True
 
     additionalProperties: Optional[  # type:ignore
         Union[
@@ -235,9 +240,12 @@ class PRQLTransform(TransformABC):
 
 class FilterTransform(TransformABC):
     filter: str
+    row_wise = True
 
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        return df.query(self.filter)
+        # the rows taken are already copied, the copy only drops the link
+        # to df, so that columns added later are not set on a copy
+        return df.query(self.filter).copy(deep=False)
 
 
 class SplitTransform(TransformABC):
@@ -464,6 +472,8 @@ class ReadCSV(BaseModel, extra="allow"):
     encoding: Optional[str] = None
     low_memory: Optional[bool] = None
     sep: Optional[str] = None
+    # rows per chunk, see ee.streamable
+    chunksize: Optional[int] = None
     # dtype: Optional[dict] = None
 
 
@@ -475,10 +485,11 @@ class ReadExcel(BaseModel, extra="allow"):
 
 class ReadFWF(BaseModel, extra="allow"):
     names: Optional[list[str]] = None
+    chunksize: Optional[int] = None
 
 
 class ReadSQL(BaseModel, extra="allow"):
-    pass
+    chunksize: Optional[int] = None
 
 
 class LAParams(BaseModel):
@@ -648,12 +659,101 @@ class Transform_(BaseModel):
             self.add_columns = value
 
 
+def to_bytes(size: Optional[Union[int, str]]) -> Optional[int]:
+    if size is None or isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", size.upper())
+    if not match:
+        raise ValueError(f"invalid size: {size}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit or " "))
+
+
+class ExecutionBackend(Enum):
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+class ExecutionLevel(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+        use_enum_values=True,
+    )
+    n_jobs: Optional[int] = None
+    backend: Optional[ExecutionBackend] = None
+
+
+# read from the root config only: worker count and backend for the
+# flows grouping target tables, the source files of a target table and
+# the tables of a source file; level settings override the run-wide ones.
+# Negative n_jobs count back from the cpu count (-1 for all cpus), fewer if
+# the largest sources would not fit in the available memory.
+# memory_limit (bytes, or with a unit: 512MB, 4GB) caps the rows held for a
+# target table, beyond it the rows are spilled to disk until persisted.
+# cache_limit caps the containers kept open between dataflows,
+# the least recently used ones with nothing left to write are closed.
+# source_cache keeps the files parsed in the user's cache directory, see
+# cache.cache_dir, for later runs, up to source_cache_limit (1GB by default).
+# schema_registry keeps the columns and dtypes of the target tables written
+# in .els_schemas.json next to the root config, not probed in later runs
+class Execution(ExecutionLevel):
+    target_tables: Optional[ExecutionLevel] = None
+    files: Optional[ExecutionLevel] = None
+    tables: Optional[ExecutionLevel] = None
+    memory_limit: Optional[Union[int, str]] = None
+    cache_limit: Optional[Union[int, str]] = None
+    source_cache: Optional[bool] = None
+    source_cache_limit: Optional[Union[int, str]] = None
+    schema_registry: Optional[bool] = None
+
+    @property
+    def memory_limit_bytes(self) -> Optional[int]:
+        return to_bytes(self.memory_limit)
+
+    @property
+    def cache_limit_bytes(self) -> Optional[int]:
+        return to_bytes(self.cache_limit)
+
+    @property
+    def source_cache_limit_bytes(self) -> Optional[int]:
+        return to_bytes(self.source_cache_limit)
+
+    def override(
+        self,
+        n_jobs: Optional[int] = None,
+        backend: Optional[ExecutionBackend] = None,
+    ) -> Execution:
+        updates: dict[str, Any] = {}
+        if n_jobs is not None:
+            updates["n_jobs"] = n_jobs
+        if backend is not None:
+            updates["backend"] = ExecutionBackend(backend).value
+        res = self.model_dump(mode="json", exclude_none=True)
+        res.update(updates)
+        for level in ("target_tables", "files", "tables"):
+            if level in res:
+                res[level].update(updates)
+        return Execution.model_validate(res)
+
+    def level_jobs(
+        self,
+        level: Literal["target_tables", "files", "tables"],
+    ) -> tuple[int, str]:
+        level_execution = getattr(self, level) or ExecutionLevel()
+        n_jobs = level_execution.n_jobs or self.n_jobs or 1
+        backend = ExecutionBackend(
+            level_execution.backend or self.backend or ExecutionBackend.PROCESS
+        )
+        return n_jobs, backend.value
+
+
 class Config(BaseModel, extra="forbid"):
     # KEEP config_path AROUND JUST IN CASE, can be used when printing yamls for debugging
     config_path: Optional[str] = None
     # source: Union[Source,list[Source]] = Source()
     source: Source = Source()
     target: Target = Target()
+    execution: Optional[Execution] = None
     transforms: Optional[
         Sequence[
             Union[
@@ -1,19 +1,193 @@
 from __future__ import annotations
 
 import io
+import mmap
 import os
-from typing import TYPE_CHECKING, Optional, TypeVar
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from typing import TYPE_CHECKING, Callable, Optional, TypeVar, Union
 
 import els.io.base as eio
 
 if TYPE_CHECKING:
+    from collections.abc import Generator, Iterable
+
     import pandas as pd
 
+V = TypeVar("V")
+
+
+# url keyed registry: once the approximate size of its entries exceeds
+# max_bytes, the least recently fetched ones that are clean (nothing left to
+# write) are closed and dropped; unbounded when max_bytes is None. Sizes are
+# measured when an entry is set, fetched again or reports it was resized, and
+# kept with their total
+class Registry(OrderedDict[str, V]):
+    def __init__(
+        self,
+        size_of: Callable[[V], int],
+        is_clean: Callable[[str, V], bool],
+        close: Callable[[V], None],
+        take_resized: Callable[[V], bool] = lambda value: False,
+    ) -> None:
+        super().__init__()
+        self.size_of = size_of
+        self.is_clean = is_clean
+        self.close = close
+        self.take_resized = take_resized
+        self.max_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self.sizes: dict[str, int] = {}
+        self.nbytes = 0
+
+    def __setitem__(self, url: str, value: V) -> None:
+        size = self.size_of(value)
+        with self.lock:
+            super().__setitem__(url, value)
+            self.nbytes += size - self.sizes.get(url, 0)
+            self.sizes[url] = size
+
+    def __delitem__(self, url: str) -> None:
+        with self.lock:
+            super().__delitem__(url)
+            self.nbytes -= self.sizes.pop(url, 0)
+
+    def pop(self, url: str) -> V:  # type:ignore[override]
+        with self.lock:
+            res = self[url]
+            del self[url]
+            return res
+
+    def clear(self) -> None:
+        with self.lock:
+            super().clear()
+            self.sizes.clear()
+            self.nbytes = 0
+
+    # measured again, the entry has grown or shrunk since it was set
+    def resize(self, url: str) -> None:
+        with self.lock:
+            value = self.get(url)
+        if value is None:
+            return
+        size = self.size_of(value)
+        with self.lock:
+            if self.get(url) is value:
+                self.nbytes += size - self.sizes.get(url, 0)
+                self.sizes[url] = size
+
+    # entries resized since they were measured
+    def refresh(self) -> None:
+        with self.lock:
+            entries = list(self.items())
+        for url, value in entries:
+            if self.take_resized(value):
+                self.resize(url)
+
+    def fetch(self, url: str) -> Optional[V]:
+        with self.lock:
+            if url not in self:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.move_to_end(url)
+            res = self[url]
+        self.resize(url)
+        self.evict(keep=url)
+        return res
+
+    def add(self, url: str, value: V) -> None:
+        self[url] = value
+        self.evict(keep=url)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        if self.max_bytes is None:
+            return
+        self.refresh()
+        with self.lock:
+            entries = list(self.items())
+        for url, value in entries:
+            if self.nbytes <= self.max_bytes:
+                break
+            if url == keep or not self.is_clean(url, value):
+                continue
+            # skipped while another thread is using it
+            lock = url_lock(url)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                with self.lock:
+                    if self.get(url) is not value:
+                        continue
+                    self.pop(url)
+                self.close(value)
+                self.evictions += 1
+            finally:
+                lock.release()
+
+    @property
+    def summary(self) -> str:
+        self.refresh()
+        return (
+            f"{len(self)} entries, {self.nbytes} bytes, {self.hits} hits, "
+            f"{self.misses} misses, {self.evictions} evictions"
+        )
+
+
+def container_clean(url: str, container: eio.ContainerProtocol) -> bool:
+    return not (isinstance(container, eio.ContainerWriterABC) and container.mode != "r")
+
 
 default_target: dict[str, pd.DataFrame] = {}
-url_dicts: dict[str, dict[str, pd.DataFrame]] = {}
-io_files: dict[str, io.BytesIO] = {}
-df_containers: dict[str, eio.ContainerProtocol] = {}
+# dataframe dicts belong to the caller, never evicted
+url_dicts: Registry[dict[str, pd.DataFrame]] = Registry(
+    size_of=lambda df_dict: sum(
+        int(df.memory_usage().sum()) for df in df_dict.values()
+    ),
+    is_clean=lambda url, df_dict: False,
+    close=lambda df_dict: None,
+)
+df_containers: Registry[eio.ContainerProtocol] = Registry(
+    size_of=lambda container: (
+        container.nbytes if isinstance(container, eio.ContainerReaderABC) else 0
+    ),
+    is_clean=container_clean,
+    close=lambda container: container.close(),
+    take_resized=lambda container: (
+        isinstance(container, eio.ContainerReaderABC) and container.take_resized()
+    ),
+)
+
+
+def set_cache_limit(max_bytes: Optional[int]) -> None:
+    df_containers.max_bytes = max_bytes
+    df_containers.evict()
+
+
+# seconds taken to extract each (url, table) source, kept for the life of the
+# process to order later runs of the same sources
+source_durations: dict[tuple[str, str], float] = {}
+# flows using the thread backend fetch from several threads at once
+url_locks: dict[str, threading.RLock] = {}
+url_locks_lock = threading.Lock()
+
+
+def url_lock(url: str) -> threading.RLock:
+    with url_locks_lock:
+        return url_locks.setdefault(url, threading.RLock())
+
+
+# several locks are always taken in the same order to avoid deadlocks
+@contextmanager
+def lock_urls(urls: Iterable[str]) -> Generator[None, None, None]:
+    with ExitStack() as stack:
+        for url in sorted(set(urls)):
+            stack.enter_context(url_lock(url))
+        yield
 
 
 def fetch_df_dict(
@@ -41,38 +215,54 @@ def fetch_df_container(
     url: Optional[str],
     replace: bool = False,
 ) -> T:
-    if isinstance(url, str):
-        if url in df_containers:
-            res = df_containers[url]
-        else:
+    if not isinstance(url, str):
+        raise Exception(f"Cannot fetch {type(container_class)} from: {url}")
+    with url_lock(url):
+        res = df_containers.fetch(url)
+        if res is None:
             res = container_class(
                 url=url,
                 replace=replace,
             )
-    else:
-        raise Exception(f"Cannot fetch {type(container_class)} from: {url}")
-    df_containers[url] = res
+            df_containers.add(url, res)
     return res  # type:ignore
 
 
-def fetch_file_io(
-    url: Optional[str],
-    replace: bool = False,
-) -> io.BytesIO:
-    if url is None:
-        raise Exception("Cannot fetch None url")
-    elif url in io_files:
-        res = io_files[url]
-    # only allows replacing once:
-    elif replace:
-        res = io.BytesIO()
-    # chck file exists:
-    elif os.path.isfile(url):
-        with open(url, "rb") as file:
-            res = io.BytesIO(file.read())
-            # res = io.StringIO(file.read())
+# sources are read from disk rather than copied into memory, targets are
+# written straight to disk too
+def fetch_source(url: str) -> Union[str, io.BytesIO]:
+    if os.path.isfile(url):
+        return url
     else:
-        res = io.BytesIO()
-        # res = io.StringIO()
-    io_files[url] = res
-    return res
+        return io.BytesIO()
+
+
+# for readers that scan the bytes themselves, a file on disk is memory mapped
+@contextmanager
+def open_source(url: str) -> Generator[Union[io.BytesIO, mmap.mmap], None, None]:
+    source = fetch_source(url)
+    if isinstance(source, io.BytesIO):
+        yield source
+    elif os.path.getsize(source) == 0:
+        # empty files cannot be mapped
+        yield io.BytesIO()
+    else:
+        with open(source, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as res:
+                yield res
+
+
+# writes a target container as soon as it is no longer used, rather than on
+# cleanup, so its frames are not held for the rest of the run
+def release_df_container(url: str) -> None:
+    with url_lock(url):
+        container = df_containers.get(url)
+        if isinstance(container, eio.ContainerWriterABC):
+            container.write()
+        evict_df_container(url)
+
+
+def evict_df_container(url: str) -> None:
+    with url_lock(url):
+        if url in df_containers:
+            df_containers.pop(url).close()
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import logging
-from collections.abc import Iterable
+import os
+from collections import Counter
+from collections.abc import Generator, Iterable
 from typing import TYPE_CHECKING, Optional, Union
 
 import numpy as np
 import pandas as pd
 
 import els.core as el
+import els.io.base as eio
+import els.io.cache as source_cache
+import els.io.schemas as schemas
 from els.io.csv import CSVContainer
 from els.io.fwf import FWFContainer
 from els.io.pd import DFContainer
@@ -17,6 +22,8 @@ from els.io.xl import XLContainer
 from els.io.xml import XMLContainer
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
     import els.config as ec
     from els.io.base import ContainerReaderABC, ContainerWriterABC, FrameABC
 
@@ -90,7 +97,7 @@ def push_frame(
 
 # TODO: add tests for this:
 def config_frames_consistent(config: ec.Config) -> bool:
-    target, source, transform = get_configs(config)
+    target, _, transform = get_configs(config)
 
     # THIS LOGIC MAY NEED TO BE RESSURECTED
     # IT IS IGNORING IDENTITY/PRIMARY KEY FIELDS IN DATABASE,
@@ -101,10 +108,9 @@ def config_frames_consistent(config: ec.Config) -> bool:
     #         if v == ec.DynamicColumnValue.ROW_INDEX.value:
     #             ignore_cols.append(k)
 
-    source_df = pull_frame(source, sample=True)
+    source_df = pull_sample(config)
     source_df = apply_transforms(source_df, transform, mark_as_executed=False)
-    target_df = pull_frame(target, sample=True)
-    return data_frames_consistent(source_df, target_df)
+    return target_consistent(source_df, target)
 
 
 def apply_transforms(
@@ -174,7 +180,62 @@ def pull_frame(
         kwargs=frame.kwargs_pull,
         sample=sample,
     )
+    return parse_dates(frame, df)
+
+
+# the source is parsed once per run: unless streamed in chunks, it is read
+# whole and the sample is its first rows, the whole frame is then reused by
+# the build, the consistency check and the ingest; not whole where the
+# ingest reads it in a worker process, the sample alone is read here
+def pull_sample(config: ec.Config, whole: bool = True) -> pd.DataFrame:
+    if config.transforms_vary_target_columns:
+        # the target columns depend on all the rows
+        return pull_frame(config.source)
+    elif whole and not streamable(config):
+        pull_frame(config.source)
+    return pull_frame(config.source, sample=True)
+
+
+# columns and dtypes of the target, without reading its rows where its
+# container can tell them, see ContainerReaderABC.schema
+def pull_schema(frame: ec.Target) -> pd.DataFrame:
+    container_class = get_container_class(frame)
+    assert isinstance(frame.url, str)
+    df_container = el.fetch_df_container(container_class, url=frame.url)
+    assert isinstance(frame.table, str)
+    df = df_container.schema(frame.table, frame.kwargs_pull)
+    return parse_dates(frame, df)
 
+
+# a mismatch with a registered schema is checked again against the target,
+# it may have changed since it was registered
+def target_consistent(df: pd.DataFrame, target: ec.Target) -> bool:
+    assert isinstance(target.url, str)
+    assert isinstance(target.table, str)
+    registered = schemas.registered(target.url, target.table)
+    if data_frames_consistent(df, pull_schema(target)):
+        return True
+    elif registered and schemas.forget(target.url, target.table):
+        return data_frames_consistent(df, pull_schema(target))
+    else:
+        return False
+
+
+# read whole in this process, see pull_sample
+def source_read(source: ec.Source) -> bool:
+    container = el.df_containers.get(str(source.url))
+    return (
+        isinstance(container, eio.ContainerReaderABC)
+        and isinstance(source.table, str)
+        and source.table in container
+        and container[source.table].mode == "r"
+    )
+
+
+def parse_dates(
+    frame: Union[ec.Source, ec.Target],
+    df: pd.DataFrame,
+) -> pd.DataFrame:
     if frame and hasattr(frame, "dtype") and frame.dtype:
         # assert df is not None
         for k, v in frame.dtype.items():
@@ -183,6 +244,31 @@ def pull_frame(
     return pd.DataFrame(df)
 
 
+# as pull_frame, in chunks of read_args.chunksize rows where the reader supports it
+def pull_frames(source: ec.Source) -> Generator[pd.DataFrame, None, None]:
+    container_class = get_container_class(source)
+    assert isinstance(source.url, str)
+    df_container = el.fetch_df_container(
+        container_class=container_class,
+        url=source.url,
+    )
+    assert isinstance(source.table, str)
+    df_table: FrameABC = df_container[source.table]
+    for df in df_table.read_chunks(kwargs=source.kwargs_pull):
+        yield parse_dates(source, df)
+
+
+def source_row_estimate(source: ec.Source) -> Optional[int]:
+    container_class = get_container_class(source)
+    assert isinstance(source.url, str)
+    df_container = el.fetch_df_container(container_class, url=source.url)
+    assert isinstance(source.table, str)
+    if source.table in df_container:
+        return df_container[source.table].row_estimate()
+    else:
+        return None
+
+
 def get_configs(
     config: ec.Config,
 ) -> tuple[
@@ -198,6 +284,8 @@ def get_configs(
 
 
 def ingest(config: ec.Config) -> bool:
+    if streamable(config):
+        return ingest_chunks(config)
     target, source, transform = get_configs(config)
     consistent = config_frames_consistent(config)
     if not target or not target.table or consistent or target.consistency == "ignore":
@@ -208,9 +296,93 @@ def ingest(config: ec.Config) -> bool:
         raise Exception(f"{target.table}: Inconsistent, not saved.")
 
 
+# sources read in chunks are written chunk by chunk, so that only one chunk is
+# held in memory: requires row-wise transforms and a target appended in place
+def streamable(config: ec.Config) -> bool:
+    target, source, transform = get_configs(config)
+    return bool(
+        source.read_args
+        and not isinstance(source.read_args, list)
+        and getattr(source.read_args, "chunksize", None)
+        and (source.type in (".csv", ".fwf") or source.type_is_db)
+        and (target.type == ".csv" or target.type_is_db)
+        and all(t.row_wise for t in transform if not t.executed)
+    )
+
+
+def ingest_chunks(config: ec.Config) -> bool:
+    target, source, transform = get_configs(config)
+    consistent = config_frames_consistent(config)
+    if not target or not target.table or consistent or target.consistency == "ignore":
+        container_class = get_writer_container_class(target)
+        transform = [t for t in transform if not t.executed]
+        for df in pull_frames(source):
+            for t in transform:
+                if df.empty:
+                    break
+                df = t(df, mark_as_executed=False)
+            if not df.empty:
+                push_frame(df, target)
+                el.fetch_df_container(container_class, target.url).flush()
+        for t in transform:
+            t.executed = True
+        return True
+    else:
+        raise Exception(f"{target.table}: Inconsistent, not saved.")
+
+
+# ingest split in two: extract only reads the source and can run in a worker;
+# load checks the target and pushes, it must run where the target containers live
+def extract(config: ec.Config) -> tuple[pd.DataFrame, pd.DataFrame]:
+    _, source, transform = get_configs(config)
+    sample_df = pull_sample(config)
+    sample_df = apply_transforms(sample_df, transform, mark_as_executed=False)
+    source_df = pull_frame(source, sample=False)
+    source_df = apply_transforms(source_df, transform)
+    return sample_df, source_df
+
+
+def extract_detached(
+    config: ec.Config,
+    cwd: str,
+    cache: tuple[Optional[Path], int] = (None, source_cache.DEFAULT_MAX_BYTES),
+) -> tuple[tuple[pd.DataFrame, pd.DataFrame], Counter[tuple[str, str]]]:
+    # worker processes are reused across runs, relative urls need the caller's cwd
+    os.chdir(cwd)
+    # and the caller's source cache settings
+    source_cache.directory, source_cache.max_bytes = cache
+    # the reads of this extract, counted in the caller's run
+    reads = Counter(eio.table_reads)
+    try:
+        return extract(config), eio.table_reads - reads
+    finally:
+        # the worker's registries are private copies, release what was read
+        assert isinstance(config.source.url, str)
+        el.evict_df_container(config.source.url)
+
+
+def load(
+    config: ec.Config,
+    sample_df: pd.DataFrame,
+    source_df: pd.DataFrame,
+) -> bool:
+    target = config.target
+    if (
+        not target
+        or not target.table
+        or target.consistency == "ignore"
+        or target_consistent(sample_df, target)
+    ):
+        return push_frame(source_df, target)
+    else:
+        raise Exception(f"{target.table}: Inconsistent, not saved.")
+
+
 def table_exists(target: ec.Target) -> bool:
     assert target.url
-    if target.type in (".csv", ".tsv"):
+    if isinstance(target.table, str) and schemas.registered(target.url, target.table):
+        return True
+    elif target.type in (".csv", ".tsv"):
         return target.file_exists
     elif (
         target.type_is_db
@@ -238,11 +410,10 @@ def requires_build_action(
         return False
 
 
-def build(config: ec.Config) -> bool:
-    target, source, transform = get_configs(config)
+def build(config: ec.Config, whole: bool = True) -> bool:
+    target, _, transform = get_configs(config)
     if requires_build_action(target):
-        sample = False if config.transforms_vary_target_columns else True
-        df = pull_frame(source, sample=sample)
+        df = pull_sample(config, whole)
         df = apply_transforms(df, transform, mark_as_executed=False)
         return push_frame(df, target, build=True)
     else:
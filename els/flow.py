@@ -1,18 +1,189 @@
 from __future__ import annotations
 
 import logging
-from typing import TYPE_CHECKING, Callable, Optional
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cached_property
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
-from anytree import NodeMixin, RenderTree  # type:ignore
-from joblib import Parallel, delayed  # type:ignore
-from joblib.externals.loky import get_reusable_executor  # type:ignore
+from anytree import NodeMixin, PreOrderIter, RenderTree  # type:ignore
+from joblib.externals.loky import cpu_count, get_reusable_executor  # type:ignore
 
 import els.core as el
 import els.execute as ee
+import els.io.base as eio
+import els.io.cache as source_cache
 
 if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from concurrent.futures import Executor, Future
+
+    import pandas as pd
+
     import els.config as ec
-    import els.io.base as eio
+
+
+# rough sizes used to compare sources before they are read: a parsed frame
+# against the bytes of its source file, a database row, and the read rate
+# assumed until a source of known size has been timed
+FRAME_BYTES_PER_SOURCE_BYTE = 5
+SOURCE_BYTES_PER_ROW = 100
+DEFAULT_SECONDS_PER_BYTE = 1e-8
+
+
+def timed_call(fn: Callable[..., Any], *args: Any) -> tuple[Any, float]:
+    start = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - start
+
+
+MEMINFO = "/proc/meminfo"
+
+
+# memory that can be had without swapping, the page cache the kernel would
+# reclaim included: MemAvailable on linux, psutil where installed, free
+# pages otherwise
+def available_memory() -> Optional[int]:
+    try:
+        with open(MEMINFO) as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil  # type:ignore
+
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        # not available on windows and macos
+        return None
+
+
+# negative n_jobs count back from the cpu count as in joblib, -1 using all
+# cpus; capped so the largest sources fit in memory together
+def adaptive_jobs(n_jobs: int, executes: Sequence[ElsExecute]) -> int:
+    res = max(1, cpu_count() + 1 + n_jobs)
+    memory = available_memory()
+    largest = max((e.source_size or 0 for e in executes), default=0)
+    if memory and largest:
+        res = min(res, max(1, memory // (largest * FRAME_BYTES_PER_SOURCE_BYTE)))
+    return res
+
+
+def seconds_per_byte(executes: Sequence[ElsExecute]) -> float:
+    timed = [
+        (el.source_durations[e.source_key], e.source_size)
+        for e in executes
+        if e.source_key in el.source_durations and e.source_size
+    ]
+    if timed:
+        return sum(duration for duration, _ in timed) / sum(size for _, size in timed)
+    else:
+        return DEFAULT_SECONDS_PER_BYTE
+
+
+# longest first, so the largest sources do not start last and hold up the run
+def by_cost(executes: Sequence[ElsExecute]) -> list[ElsExecute]:
+    rate = seconds_per_byte(executes)
+    return sorted(executes, key=lambda e: e.cost(rate), reverse=True)
+
+
+# one worker pool per backend, shared by all flows of a run
+class FlowExecutor:
+    def __init__(self, max_workers: int = 1) -> None:
+        self.max_workers = max_workers
+        self.thread_pool: Optional[ThreadPoolExecutor] = None
+        self.process_pool: Optional[Executor] = None
+        self.lock = threading.Lock()
+        self.tasks = 0
+        # summed duration of the calls, measured where they ran
+        self.work_time = 0.0
+        # wall time of the maps not covered by the work spread over the workers:
+        # worker startup, pickling, dispatch and imbalance
+        self.schedule_time = 0.0
+
+    def pool(self, backend: str) -> Executor:
+        with self.lock:
+            if backend == "thread":
+                if self.thread_pool is None:
+                    self.thread_pool = ThreadPoolExecutor(self.max_workers)
+                return self.thread_pool
+            else:
+                if self.process_pool is None:
+                    self.process_pool = get_reusable_executor(self.max_workers)
+                return self.process_pool
+
+    def map(
+        self,
+        calls: Sequence[tuple[Callable[..., Any], tuple[Any, ...]]],
+        n_jobs: int,
+        backend: str,
+        keys: Optional[Sequence[tuple[str, str]]] = None,
+        pooled: bool = False,
+    ) -> list[Any]:
+        start = time.perf_counter()
+        n_jobs = self.effective_jobs(n_jobs, len(calls))
+        # pooled: sent to the pool even one at a time, as other flows are
+        if n_jobs == 1 and not pooled:
+            timed = [timed_call(fn, *args) for fn, args in calls]
+        else:
+            timed = self.submit(self.pool(backend), calls, n_jobs)
+        elapsed = time.perf_counter() - start
+        work_time = sum(duration for _, duration in timed)
+        if keys is not None:
+            el.source_durations.update(zip(keys, (duration for _, duration in timed)))
+        with self.lock:
+            self.tasks += len(calls)
+            self.work_time += work_time
+            self.schedule_time += max(0.0, elapsed - work_time / n_jobs)
+        return [res for res, _ in timed]
+
+    def effective_jobs(self, n_jobs: int, n_calls: int) -> int:
+        return max(1, min(n_jobs, n_calls, self.max_workers))
+
+    @staticmethod
+    def submit(
+        pool: Executor,
+        calls: Sequence[tuple[Callable[..., Any], tuple[Any, ...]]],
+        n_jobs: int,
+    ) -> list[tuple[Any, float]]:
+        # keeps at most n_jobs in flight, the pool is shared with other flows
+        res: list[Any] = [None] * len(calls)
+        pending = iter(enumerate(calls))
+        futures: dict[Future[tuple[Any, float]], int] = {}
+        for i, (fn, args) in islice(pending, n_jobs):
+            futures[pool.submit(timed_call, fn, *args)] = i
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                res[futures.pop(future)] = future.result()
+                for i, (fn, args) in islice(pending, 1):
+                    futures[pool.submit(timed_call, fn, *args)] = i
+        return res
+
+    def shutdown(self) -> None:
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown(wait=True)
+            self.thread_pool = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
+            self.process_pool = None
+
+    @property
+    def summary(self) -> str:
+        return (
+            f"{self.tasks} tasks, work: {self.work_time:.3f}s, "
+            f"scheduling: {self.schedule_time:.3f}s"
+        )
 
 
 class FlowNodeMixin(NodeMixin):
@@ -26,6 +197,113 @@ class FlowNodeMixin(NodeMixin):
     def execute(self) -> None:
         pass
 
+    # writer-side work required before the descendant executes can be detached,
+    # returns the executes that are ready to run; whole as in ee.pull_sample
+    def prepare(self, whole: bool = True) -> list[ElsExecute]:
+        res: list[ElsExecute] = []
+        for child in self.children:
+            res.extend(child.prepare(whole))
+        return res
+
+    @property
+    def executes(self) -> list[ElsExecute]:
+        return [node for node in PreOrderIter(self) if isinstance(node, ElsExecute)]
+
+    # (url, table) pairs read and written by the descendant executes
+    @property
+    def reads(self) -> set[tuple[str, str]]:
+        return {e.source_key for e in self.executes}
+
+    @property
+    def writes(self) -> set[tuple[str, str]]:
+        return {e.target_key for e in self.executes}
+
+    @property
+    def source_urls(self) -> set[str]:
+        return {url for url, _ in self.reads}
+
+    @property
+    def target_urls(self) -> set[str]:
+        return {url for url, _ in self.writes}
+
+    @property
+    def container_urls(self) -> set[str]:
+        return self.source_urls | self.target_urls
+
+    @property
+    def replaced_urls(self) -> set[str]:
+        return {
+            e.target_key[0] for e in self.executes if e.config.target.replace_container
+        }
+
+
+# for each group, the earlier groups it must wait for: ordering is kept between
+# groups reading and writing the same table, or sharing a container that one of
+# them replaces; groups writing different tables of a container only exclude
+# each other while building and loading, unless keep_target_order is set
+def group_dependencies(
+    groups: Sequence[ElsTargetTableWrapper],
+    keep_target_order: bool = False,
+) -> dict[ElsTargetTableWrapper, set[ElsTargetTableWrapper]]:
+    res: dict[ElsTargetTableWrapper, set[ElsTargetTableWrapper]] = {}
+    readers: defaultdict[tuple[str, str], list[ElsTargetTableWrapper]]
+    writers: defaultdict[tuple[str, str], list[ElsTargetTableWrapper]]
+    readers, writers = defaultdict(list), defaultdict(list)
+    users: defaultdict[str, list[ElsTargetTableWrapper]] = defaultdict(list)
+    replacers: defaultdict[str, list[ElsTargetTableWrapper]] = defaultdict(list)
+    target_writers: defaultdict[str, list[ElsTargetTableWrapper]] = defaultdict(list)
+    for group in groups:
+        reads, writes = group.reads, group.writes
+        urls, replaced = group.container_urls, group.replaced_urls
+        target_urls = {url for url, _ in writes}
+        earlier: set[ElsTargetTableWrapper] = set()
+        for key in reads:
+            earlier.update(writers[key])
+        for key in writes:
+            earlier.update(readers[key], writers[key])
+        for url in replaced:
+            earlier.update(users[url])
+        for url in urls:
+            earlier.update(replacers[url])
+        if keep_target_order:
+            for url in target_urls:
+                earlier.update(target_writers[url])
+        res[group] = earlier
+        for key in reads:
+            readers[key].append(group)
+        for key in writes:
+            writers[key].append(group)
+        for url in target_urls:
+            target_writers[url].append(group)
+        for url in urls:
+            users[url].append(group)
+        for url in replaced:
+            replacers[url].append(group)
+    return res
+
+
+# dependency order, each group followed where possible by one reading the same
+# source containers, so that a container is read by consecutive groups
+def source_order(
+    groups: Sequence[ElsTargetTableWrapper],
+    before: Optional[dict[ElsTargetTableWrapper, set[ElsTargetTableWrapper]]] = None,
+) -> list[ElsTargetTableWrapper]:
+    res: list[ElsTargetTableWrapper] = []
+    placed: set[ElsTargetTableWrapper] = set()
+    pending = list(groups)
+    while pending:
+        ready = [g for g in pending if before is None or before[g] <= placed]
+        group = ready[0]
+        if res:
+            last = res[-1].source_urls
+            group = next(
+                (g for g in ready if not last.isdisjoint(g.source_urls)), group
+            )
+        res.append(group)
+        placed.add(group)
+        pending.remove(group)
+    return res
+
 
 class SerialNodeMixin:
     @property
@@ -51,37 +329,294 @@ class ElsExecute(FlowNodeMixin):
         self.name = f"{name} ({execute_fn.__name__}) {source_name} → {target_name}"
         self.config = config
         self.execute_fn = execute_fn
+        # set once the source is in the target container
+        self.loaded = False
 
     def execute(self) -> None:
         if self.execute_fn(self.config):
-            pass
+            self.loaded = True
+        else:
+            logging.info("EXECUTE FAILED: " + self.name)
+        self.done()
+
+    def prepare(self, whole: bool = True) -> list[ElsExecute]:
+        return [self]
+
+    # executed, loaded or skipped: one less user of the source container
+    def done(self) -> None:
+        root: ElsFlow = self.root
+        root.release_source(self.source_key[0])
+
+    @property
+    def source_key(self) -> tuple[str, str]:
+        return str(self.config.source.url), str(self.config.source.table)
+
+    @property
+    def target_key(self) -> tuple[str, str]:
+        return str(self.config.target.url), str(self.config.target.table)
+
+    # bytes on disk, or estimated from the row count kept by the database
+    @cached_property
+    def source_size(self) -> Optional[int]:
+        source = self.config.source
+        if source.url_scheme == "file" and source.file_exists:
+            assert source.url
+            return os.path.getsize(source.url)
+        elif source.type_is_db:
+            rows = ee.source_row_estimate(source)
+            return None if rows is None else rows * SOURCE_BYTES_PER_ROW
+        else:
+            return None
+
+    # expected seconds: as long as the last run of the same source, if any
+    def cost(self, seconds_per_byte: float) -> float:
+        if self.source_key in el.source_durations:
+            return el.source_durations[self.source_key]
+        else:
+            return (self.source_size or 0) * seconds_per_byte
+
+    @property
+    def detachable(self) -> bool:
+        # only ingest is split into a worker-side extract and a writer-side load,
+        # chunked ingests write as they read and stay in the writer
+        return self.execute_fn.__qualname__ == ee.ingest.__qualname__ and not (
+            ee.streamable(self.config)
+        )
+
+    def load(self, extracted: tuple[pd.DataFrame, pd.DataFrame]) -> None:
+        if ee.load(self.config, *extracted):
+            self.loaded = True
         else:
             logging.info("EXECUTE FAILED: " + self.name)
+        self.done()
 
 
 class ElsFlow(FlowNodeMixin):
-    def __init__(self, parent: Optional[FlowNodeMixin] = None, n_jobs: int = 1) -> None:
+    def __init__(
+        self,
+        parent: Optional[FlowNodeMixin] = None,
+        n_jobs: int = 1,
+        backend: str = "process",
+    ) -> None:
         self.parent = parent
-        self.n_jobs = n_jobs
+        # as configured, see n_jobs
+        self.jobs = n_jobs
+        self.backend = backend
+        self._executor: Optional[FlowExecutor] = None
+        # executes yet to read each source container, set on the root
+        self.source_users: Counter[str] = Counter()
+        self.source_users_lock = threading.Lock()
+
+    @property
+    def n_jobs(self) -> int:
+        if self.jobs > 0:
+            return self.jobs
+        else:
+            return adaptive_jobs(self.jobs, self.executes)
 
     def execute(self) -> None:
-        with Parallel(n_jobs=self.n_jobs, backend="loky") as parallel:
-            parallel(delayed(t.execute)() for t in self)
-            get_reusable_executor().shutdown(wait=True)
+        if self.is_root:
+            self.execute_groups()
+        elif self.n_jobs == 1:
+            for t in self:
+                t.execute()
+        elif not self.independent:
+            logging.info(f"{self.name}: tables written are also read, not detached")
+            for t in self:
+                t.execute()
+        else:
+            self.execute_detached()
+
+    # detached extracts all run before the first load, so no execute may read
+    # a table that another execute of the flow writes
+    @property
+    def independent(self) -> bool:
+        return self.reads.isdisjoint(self.writes)
+
+    def detach(self, execute: ElsExecute) -> bool:
+        if not execute.detachable:
+            return False
+        # in-memory sources are only registered in this process
+        elif self.backend == "process" and execute.config.source.type == "dict":
+            return False
+        # tables loaded earlier in the run are only written on cleanup
+        elif self.backend == "process" and self.pending_target(execute):
+            return False
+        # read whole by the build, loaded from it rather than read again by
+        # a worker process; threads share the frame read
+        elif self.backend == "process" and ee.source_read(execute.config.source):
+            return False
+        else:
+            return True
+
+    @staticmethod
+    def pending_target(execute: ElsExecute) -> bool:
+        container = el.df_containers.get(execute.config.source.url or "")
+        return container is not None and container.mode != "r"
+
+    # workers read and transform the sources, the results are then loaded here,
+    # in order, since all target containers are held by this process' registries
+    def execute_detached(self) -> None:
+        self.extract_and_load(self.prepare(whole=not self.in_workers))
+
+    # extracts expected to run in worker processes, the builds then only read
+    # samples of their sources so that the whole reads are left to the workers
+    @property
+    def in_workers(self) -> bool:
+        return (
+            self.backend == "process"
+            and self.executor.max_workers > 1
+            and (self.n_jobs > 1 or self.groups_concurrent)
+        )
+
+    # target table groups run side by side, see execute_scheduled
+    @property
+    def groups_concurrent(self) -> bool:
+        return not self.is_root and self.root.n_jobs > 1
+
+    def extract_and_load(self, executes: list[ElsExecute]) -> None:
+        n_jobs = self.n_jobs
+        detached = [e for e in executes if self.detach(e)]
+        if n_jobs > 1:
+            detached = by_cost(detached)
+        calls: list[tuple[Callable[..., Any], tuple[Any, ...]]]
+        # a group extracting alone still uses the pool while other groups do
+        in_workers = self.in_workers and (
+            self.executor.effective_jobs(n_jobs, len(detached)) > 1
+            or (self.groups_concurrent and bool(detached))
+        )
+        if in_workers:
+            cwd = os.getcwd()
+            cache = (source_cache.directory, source_cache.max_bytes)
+            calls = [(ee.extract_detached, (e.config, cwd, cache)) for e in detached]
+        else:
+            calls = [(ee.extract, (e.config,)) for e in detached]
+        extracted = self.executor.map(
+            calls,
+            n_jobs,
+            self.backend,
+            [e.source_key for e in detached],
+            pooled=in_workers,
+        )
+        if in_workers:
+            # counted by the workers, see ee.extract_detached
+            for _, reads in extracted:
+                eio.table_reads.update(reads)
+            extracted = [res for res, _ in extracted]
+        results = dict(zip(map(id, detached), extracted))
+        for execute in executes:
+            if id(execute) in results:
+                with el.lock_urls([execute.target_key[0]]):
+                    execute.load(results.pop(id(execute)))
+            else:
+                with el.lock_urls(execute.container_urls):
+                    execute.execute()
+
+    # the target table groups of the root flow, in order or scheduled
+    def execute_groups(self) -> None:
+        groups: list[ElsTargetTableWrapper] = list(self.children)
+        users = Counter(url for group in groups for url in group.container_urls)
+        # containers also written are released as targets
+        self.source_users = Counter(
+            e.source_key[0]
+            for e in self.executes
+            if e.source_key[0] not in self.target_urls
+        )
+        if self.n_jobs == 1:
+            # groups writing the same container keep their order
+            before = group_dependencies(groups, keep_target_order=True)
+            for group in source_order(groups, before):
+                group.execute()
+                self.release_targets(group, users)
+        else:
+            self.execute_scheduled(groups, users)
+
+    # a source container is closed and evicted once its last execute is done,
+    # rather than held until cleanup
+    def release_source(self, url: str) -> None:
+        with self.source_users_lock:
+            if url not in self.source_users:
+                return
+            self.source_users[url] -= 1
+            released = self.source_users[url] == 0
+        if released:
+            el.evict_df_container(url)
+
+    # target containers are written and freed once the last group using them
+    # is done, so only the containers of the running groups are held
+    @staticmethod
+    def release_targets(group: ElsTargetTableWrapper, users: Counter[str]) -> None:
+        users.subtract(group.container_urls)
+        for url in {url for url, _ in group.writes}:
+            if users[url] == 0:
+                el.release_df_container(url)
+
+    # runs the target table groups of the root flow on n_jobs threads, a group
+    # waits for the earlier groups it depends on (see group_dependencies);
+    # ready groups start longest first
+    def execute_scheduled(
+        self,
+        groups: list[ElsTargetTableWrapper],
+        users: Counter[str],
+    ) -> None:
+        depends_on = group_dependencies(groups)
+        rate = seconds_per_byte(self.executes)
+        costs = {group: sum(e.cost(rate) for e in group.executes) for group in groups}
+        by_group_cost = sorted(groups, key=costs.__getitem__, reverse=True)
+        done: set[ElsTargetTableWrapper] = set()
+        running: dict[Future[None], ElsTargetTableWrapper] = {}
+        with ThreadPoolExecutor(self.n_jobs) as pool:
+            while len(done) < len(groups):
+                ready = [
+                    group
+                    for group in by_group_cost
+                    if group not in done
+                    and group not in running.values()
+                    and depends_on[group] <= done
+                ]
+                for group in source_order(ready):
+                    running[pool.submit(group.execute_concurrent)] = group
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    group = running.pop(future)
+                    done.add(group)
+                    self.release_targets(group, users)
+
+    @property
+    def max_jobs(self) -> int:
+        return max(
+            node.n_jobs for node in PreOrderIter(self) if isinstance(node, ElsFlow)
+        )
+
+    # held by the root flow, set by the TaskFlow running it
+    @property
+    def executor(self) -> FlowExecutor:
+        root: ElsFlow = self.root
+        if root._executor is None:
+            root._executor = FlowExecutor(root.max_jobs)
+        return root._executor
+
+    @executor.setter
+    def executor(self, executor: FlowExecutor) -> None:
+        root: ElsFlow = self.root
+        root._executor = executor
 
     @property
     def name(self) -> str:
         if self.is_root:
             return "FlowRoot"
+        elif self.jobs > 0:
+            return f"flow ({self.jobs} jobs, {self.backend})"
         else:
-            return f"flow ({self.n_jobs} jobs)"
+            return f"flow (auto jobs, {self.backend})"
 
 
 class BuildWrapperMixin(FlowNodeMixin):
-    def build_target(self) -> bool:
+    def build_target(self, whole: bool = True) -> bool:
         flow_child = self[0]
         build_item: ElsExecute = flow_child[0]
-        if ee.build(build_item.config):
+        if ee.build(build_item.config, whole):
             res = True
         else:
             res = False
@@ -106,12 +641,11 @@ class ElsContainerWrapper(BuildWrapperMixin, SerialNodeMixin):
     def execute(self) -> None:
         self.open()
         self[0].execute()
-        # self.close()
 
-    # def close(self):
-    #     file = el.df_containers[self.file_path]
-    #     file.close()
-    #     del el.df_containers[self.file_path]
+    # for executes that will not run, the others release as they are done
+    def close(self) -> None:
+        for execute in self.executes:
+            execute.done()
 
     @property
     def name(self) -> str:
@@ -130,5 +664,26 @@ class ElsTargetTableWrapper(FlowNodeMixin, SerialNodeMixin):
         file_child.open()
         if file_child.build_target():
             flow_child.execute()
-        # else:
-        #     file_child.close()
+        else:
+            for child in flow_child:
+                child.close()
+
+    def prepare(self, whole: bool = True) -> list[ElsExecute]:
+        file_child: ElsContainerWrapper = self[0][0]
+        with el.lock_urls(self.container_urls):
+            file_child.open()
+            built = file_child.build_target(whole)
+        if built:
+            return super().prepare(whole)
+        else:
+            for child in self[0]:
+                child.close()
+            return []
+
+    def execute_concurrent(self) -> None:
+        flow_child: ElsFlow = self[0]
+        if flow_child.independent:
+            flow_child.extract_and_load(self.prepare(not flow_child.in_workers))
+        else:
+            with el.lock_urls(self.container_urls):
+                self.execute()
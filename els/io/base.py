@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import uuid
 from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import contextmanager
 from typing import TYPE_CHECKING, Generic, Optional, Protocol, TypeVar
 
 import pandas as pd
 
+from . import cache as source_cache
+from . import schemas
+
 if TYPE_CHECKING:
     from collections.abc import Generator, Sequence
 
@@ -17,6 +28,28 @@ if TYPE_CHECKING:
 
 
 nrows_for_sampling: int = 100
+# bytes of appends a frame holds before spilling them to disk, see FrameABC.spill
+memory_limit: Optional[int] = None
+# times each (url, table) was parsed whole or loaded from the source cache
+# during the run, once per table unless read again after being released;
+# samples of its first rows are not counted
+table_reads: Counter[tuple[str, str]] = Counter()
+
+
+# files are written whole to a temporary path next to them, renamed over the
+# original once complete: a failed write leaves the original untouched
+@contextmanager
+def replacing_file(path: str) -> Generator[str, None, None]:
+    head, tail = os.path.split(path)
+    temp_path = os.path.join(head, f".{uuid.uuid4().hex}.{tail}")
+    try:
+        yield temp_path
+        if os.path.isfile(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
 
 
 def multiindex_to_singleindex(
@@ -64,8 +97,19 @@ class FrameABC(ABC):
         # where results will be written/appended to on self.write():
         self.df_target = df
         # where intermediate operations (truncate, append, etc) are performed:
+        self.pieces: list[pd.DataFrame] = []
+        self.pieces_bytes = 0
+        self._sample: pd.DataFrame = df
+        self.sampled: int = 0
+        # appends spilled to disk, as pickled lists of frames
+        self.segments: list[str] = []
+        self.spill_dir: Optional[tempfile.TemporaryDirectory[str]] = None
+        # source cache entry df was read from, see read_cached
+        self.cache_key: Optional[str] = None
         self.df = df
         self.kwargs_pull = kwargs_pull or {}
+        # set once written to the container before it closes, see flush
+        self.flushed = False
 
     def read(
         self,
@@ -75,25 +119,172 @@ class FrameABC(ABC):
         kwargs = kwargs or {}
         if sample:
             kwargs["nrows"] = nrows_for_sampling
-        if self.mode in ("s"):
-            self._read(kwargs)
-            if (
-                not sample
-                # when len(df) > nrows: sample was ignored due to kwargs
-                # when len(df) < rorws: small dataset
-                or (sample and len(self.df) != nrows_for_sampling)
-            ):
+        # frames of a container share its io, read one at a time
+        with self.parent.lock:
+            parsed = False
+            if self.mode in ("s"):
+                parsed = self.read_cached(kwargs)
+                if (
+                    not sample
+                    # when len(df) > nrows: sample was ignored due to kwargs
+                    # when len(df) < rorws: small dataset
+                    or (sample and len(self.df) != nrows_for_sampling)
+                ):
+                    self.mode = "r"
+                else:
+                    self.mode = "m"
+            elif self.mode == "m" and not sample:
+                parsed = self.read_cached(kwargs)
                 self.mode = "r"
-            else:
-                self.mode = "m"
-        elif self.mode == "m" and not sample:
+            elif sample and (self.pieces or self.segments):
+                return self.take_sample()
+            elif sample and self.mode == "r":
+                # read whole: the sample is a copy of its first rows
+                return self.df.head(nrows_for_sampling).copy()
+            # bounded sample reads are not counted
+            if parsed and self.mode == "r":
+                self.count_read()
+            return self.df
+
+    # with the source cache enabled, files parsed by an earlier run with the
+    # same arguments are loaded from it
+    def read_cached(self, kwargs: KWArgsIO) -> bool:
+        key = None
+        if self.parent.cacheable:
+            key = source_cache.cache_key(
+                self.__class__.__name__, self.parent.url, self.name, kwargs
+            )
+        if key is not None and key == self.cache_key:
+            return False
+        if key is None:
             self._read(kwargs)
-            self.mode = "r"
-        return self.df
+        else:
+            df = source_cache.load(key)
+            if df is None:
+                self._read(kwargs)
+                source_cache.store(key, self.df)
+            else:
+                self.df = df
+            self.cache_key = key
+        return True
+
+    # see table_reads
+    def count_read(self) -> None:
+        table_reads[(self.parent.url, self.name)] += 1
+
+    # first rows of the frame with its appends, keeping the dtypes the whole
+    # frame will have; only the heads of the appends since the last sample
+    # are concatenated
+    def take_sample(self) -> pd.DataFrame:
+        self._sample = append_into(
+            [
+                self._sample,
+                *(df.head(nrows_for_sampling) for df in self.pieces[self.sampled :]),
+            ]
+        ).head(nrows_for_sampling)
+        self.sampled = len(self.pieces)
+        return self._sample
+
+    # appends are concatenated once, when the whole frame is needed, instead
+    # of copying everything appended so far on each append
+    @property
+    def df(self) -> pd.DataFrame:
+        if self.pieces or self.segments:
+            self.df = append_into([self._df, *self.spilled_pieces, *self.pieces])
+        return self._df
+
+    @df.setter
+    def df(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self.parent.resized = True
+        self.pieces = []
+        self.pieces_bytes = 0
+        self._sample = df.head(nrows_for_sampling)
+        self.sampled = 0
+        self.segments = []
+        self.cache_key = None
+        if self.spill_dir is not None:
+            self.spill_dir.cleanup()
+            self.spill_dir = None
+
+    # approximate size, measured deeply on the sample only; appends not
+    # sampled yet are measured on the head of the first, the sample is left
+    @property
+    def nbytes(self) -> int:
+        rows = len(self._df) + sum(len(df) for df in self.pieces)
+        sample = self._sample
+        if sample.empty and self.pieces:
+            sample = self.pieces[0].head(nrows_for_sampling)
+        if not rows or sample.empty:
+            return 0
+        sample_bytes = sample.memory_usage(deep=True).sum()
+        return int(sample_bytes * rows / len(sample))
+
+    @property
+    def empty(self) -> bool:
+        return (
+            self._df.empty and all(df.empty for df in self.pieces) and not self.segments
+        )
+
+    # with a memory_limit, the appends held by a frame of a container that
+    # persists in chunks are moved to disk once they exceed it
+    def spill(self) -> None:
+        # the sample keeps the heads of the appends moved
+        self.take_sample()
+        if self.spill_dir is None:
+            # created by this process for its user alone (0700), the
+            # pickles read back are only the ones written here
+            self.spill_dir = tempfile.TemporaryDirectory(prefix="els-")
+        path = os.path.join(self.spill_dir.name, f"{len(self.segments)}.pickle")
+        with open(path, "wb") as file:
+            pickle.dump(self.pieces, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.segments.append(path)
+        self.pieces = []
+        self.pieces_bytes = 0
+        self.sampled = 0
+
+    @property
+    def spilled_pieces(self) -> Generator[pd.DataFrame, None, None]:
+        for path in self.segments:
+            with open(path, "rb") as file:
+                yield from pickle.load(file)
+
+    # df_target as set by write(), one piece at a time when spilled to disk
+    def target_chunks(self) -> Generator[pd.DataFrame, None, None]:
+        if not self.segments:
+            yield self.df_target
+            return
+        if self.mode == "a" and not self.df_target.empty:
+            yield self.df_target
+        columns = self.column_frame
+        for df in (self._df, *self.spilled_pieces, *self.pieces):
+            if not df.empty:
+                yield append_into([columns, df])
+
+    # frames that cannot be read in chunks are read in one piece
+    def read_chunks(self, kwargs: KWArgsIO) -> Generator[pd.DataFrame, None, None]:
+        kwargs.pop("chunksize", None)
+        yield self.read(kwargs)
+
+    # releases the rows persisted by the container, leaving the frame as if
+    # just found in it: the next write appends to what was persisted
+    def flush(self) -> None:
+        self.df = self.column_frame
+        self.df_target = self.df
+        self.mode = "s"
+        self.kwargs_pull = {}
+        self.flushed = True
+
+    # row count known without reading the frame, if any
+    def row_estimate(self) -> Optional[int]:
+        return None
 
     def write(self) -> None:
         if self.mode not in ("a", "w"):
             return
+        elif self.segments:
+            # persisted from the segments, see target_chunks
+            return
         elif self.mode == "a" and not self.df_target.empty:
             self.df_target = append_into([self.df_target, self.df])
         else:
@@ -101,7 +292,10 @@ class FrameABC(ABC):
 
     @property
     def column_frame(self) -> pd.DataFrame:
-        return get_column_frame(self.df)
+        if self.segments:
+            return get_column_frame(self.take_sample())
+        else:
+            return get_column_frame(self.df)
 
     def append(
         self,
@@ -111,7 +305,12 @@ class FrameABC(ABC):
         if truncate_first:
             self.df = append_into([self.column_frame, df])
         else:
-            self.df = append_into([self.df, df])
+            self.pieces.append(df)
+            self.parent.resized = True
+            if memory_limit is not None and self.parent.persists_chunks:
+                self.pieces_bytes += int(df.memory_usage(deep=True).sum())
+                if self.pieces_bytes > memory_limit:
+                    self.spill()
 
     def build(self, df: pd.DataFrame) -> pd.DataFrame:
         df = get_column_frame(df)
@@ -126,12 +325,18 @@ class FrameABC(ABC):
         kwargs_push: Optional[KWArgsIO] = None,
         build: bool = False,
     ) -> None:
+        # rows flushed earlier in the run are kept
+        if self.flushed:
+            if_exists = "append"
         self.if_exists = if_exists
         self.kwargs_push = kwargs_push or {}
         # build always builds from the source, does not check against target
         # consistency check done separately
         if build:
             df = self.build(df)
+        if self.mode == "s" and not self.flushed:
+            # not read: the columns appends are aligned with
+            self.df = self.parent.schema(self.name, self.kwargs_pull)
         if self.mode not in ("a", "w"):  # if in read mode, code below is first write
             if if_exists == "fail":
                 raise Exception(
@@ -166,6 +371,8 @@ class ContainerProtocol(Protocol):
     def close(self) -> None: ...
     @property
     def child_names(self) -> list[str]: ...
+    @property
+    def mode(self) -> ContainerModeLiteral: ...
 
     # def fetch_child(
     #     self,
@@ -178,6 +385,11 @@ class ContainerProtocol(Protocol):
 
 class ContainerReaderABC(ABC, Generic[TFrame]):
     # class ContainerReaderABC(ABC):
+    # persist writes the frames from FrameABC.target_chunks
+    persists_chunks = False
+    # files that can be kept in the source cache once parsed
+    cacheable = False
+
     def __init__(
         self,
         child_class: type[TFrame],
@@ -187,6 +399,9 @@ class ContainerReaderABC(ABC, Generic[TFrame]):
         self.children: list[TFrame] = []
         self.child_class = child_class
         self.url = url
+        self.lock = threading.RLock()
+        # set as frames are read or appended to, see Registry.refresh
+        self.resized = False
         self._children_init()
 
     def __contains__(self, child_name: str) -> bool:
@@ -216,6 +431,33 @@ class ContainerReaderABC(ABC, Generic[TFrame]):
     def child_names(self) -> list[str]:
         return [child.name for child in self]
 
+    @property
+    def nbytes(self) -> int:
+        with self.lock:
+            return sum(child.nbytes for child in self)
+
+    def take_resized(self) -> bool:
+        with self.lock:
+            res, self.resized = self.resized, False
+            return res
+
+    # columns and dtypes of a table as an empty frame: from the frame once
+    # read or written, otherwise from the schema registry or what the
+    # container can tell without reading its rows, see _schema
+    def schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        frame = self[table]
+        with self.lock:
+            if frame.mode == "s":
+                registered = schemas.lookup(self.url, table)
+                if registered is not None:
+                    return registered
+                return self._schema(table, kwargs)
+            return get_column_frame(frame.read(kwargs, sample=True))
+
+    # a sample of the rows where the container has no cheaper way
+    def _schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        return get_column_frame(self[table].read(kwargs, sample=True))
+
     @abstractmethod
     def _children_init(self) -> None:
         pass
@@ -238,6 +480,8 @@ class ContainerWriterABC(ContainerReaderABC[TFrame], Generic[TFrame]):
         self.url = url
         self.replace = replace
         self.children: list[TFrame] = []
+        self.lock = threading.RLock()
+        self.resized = False
 
         if not self.create_or_replace:
             self._children_init()
@@ -266,7 +510,7 @@ class ContainerWriterABC(ContainerReaderABC[TFrame], Generic[TFrame]):
     def any_empty_frames(self) -> bool:
         for df_io in self:
             if df_io.mode in ("a", "w"):
-                if df_io.df.empty:
+                if df_io.empty:
                     return True
         return False
 
@@ -275,9 +519,25 @@ class ContainerWriterABC(ContainerReaderABC[TFrame], Generic[TFrame]):
         if self.mode != "r":
             if self.any_empty_frames:
                 raise Exception("Cannot write empty dataframe")
+            replaced = self.mode == "w"
             for df_io in self:
                 df_io.write()
             self.persist()
+            if replaced:
+                # tables not written again are gone
+                schemas.forget(self.url)
+            for df_io in self:
+                if df_io.mode in ("a", "w"):
+                    schemas.record(self.url, df_io.name, df_io.column_frame)
+
+    # writes now instead of on close, so a target written in chunks only ever
+    # holds the rows of one chunk
+    def flush(self) -> None:
+        self.write()
+        self.replace = False
+        for df_io in self:
+            if df_io.mode in ("a", "w"):
+                df_io.flush()
 
     # def add_child(self: TContainer, child: TFrame) -> None:
     #     child.parent = self
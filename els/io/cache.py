@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from els._typing import KWArgsIO
+
+# parsed sources kept on disk between runs, enabled by execution.source_cache:
+# frames read from an unchanged file with the same arguments are loaded from
+# the cache instead of being parsed again
+DEFAULT_MAX_BYTES = 1024**3
+
+directory: Optional[Path] = None
+max_bytes: int = DEFAULT_MAX_BYTES
+hits = 0
+misses = 0
+
+# content digests by (path, size, mtime), a file is hashed once per process
+digests: dict[tuple[str, int, int], str] = {}
+# bytes of the entries of each cache directory: measured by the first store
+# of the process, then kept up to date by the stores and prunes
+totals: dict[Path, int] = {}
+lock = threading.Lock()
+
+
+# entries are pickles, loading one can run code: they are kept in the user's
+# cache directory, one directory per root config, rather than in the project
+# tree where others, or a commit, could put them
+def cache_dir(root_dir: Path) -> Path:
+    if os.name == "nt":
+        home = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    root_dir = root_dir.resolve()
+    project = hashlib.blake2b(str(root_dir).encode(), digest_size=8).hexdigest()
+    return Path(home) / "els" / f"{root_dir.name}-{project}"
+
+
+# only entries the user alone can have written are loaded
+def private(path: Path) -> bool:
+    if not hasattr(os, "getuid"):
+        # windows: the user's local app data
+        return True
+    stat = path.stat()
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def file_digest(path: str) -> tuple[int, int, str]:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with lock:
+        if key in digests:
+            return stat.st_size, stat.st_mtime_ns, digests[key]
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    with lock:
+        digests[key] = digest.hexdigest()
+    return stat.st_size, stat.st_mtime_ns, digests[key]
+
+
+def cache_key(
+    kind: str,
+    url: str,
+    name: str,
+    kwargs: KWArgsIO,
+) -> Optional[str]:
+    if directory is None or not os.path.isfile(url):
+        return None
+    size, mtime, digest = file_digest(url)
+    key = json.dumps(
+        [kind, os.path.abspath(url), size, mtime, digest, name, kwargs],
+        sort_keys=True,
+        default=repr,
+    )
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def load(key: str) -> Optional[pd.DataFrame]:
+    global hits, misses
+    assert directory is not None
+    path = directory / f"{key}.pickle"
+    try:
+        if not (private(directory) and private(path)):
+            logging.warning(f"Source cache: {path} writable by others, not loaded")
+            raise PermissionError(path)
+        with open(path, "rb") as file:
+            df: pd.DataFrame = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        misses += 1
+        return None
+    # last used first when pruning
+    os.utime(path)
+    hits += 1
+    return df
+
+
+def store(key: str, df: pd.DataFrame) -> None:
+    assert directory is not None
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    path = directory / f"{key}.pickle"
+    with lock:
+        if directory not in totals:
+            totals[directory] = sum(size for _, size, _ in entries(directory))
+    temp_path = directory / f".{uuid.uuid4().hex}.pickle"
+    with open(temp_path, "wb") as file:
+        pickle.dump(df, file, protocol=pickle.HIGHEST_PROTOCOL)
+    stored = temp_path.stat().st_size
+    with lock:
+        try:
+            # written again: the entry replaced no longer counts
+            totals[directory] -= path.stat().st_size
+        except OSError:
+            pass
+        os.replace(temp_path, path)
+        totals[directory] += stored
+        full = totals[directory] > max_bytes
+    if full:
+        prune(directory, max_bytes)
+
+
+# (mtime, size, path) of the entries, skipping those removed meanwhile
+def entries(cache_dir: Path) -> list[tuple[float, int, Path]]:
+    res = []
+    for path in cache_dir.glob("*.pickle"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        res.append((stat.st_mtime, stat.st_size, path))
+    return res
+
+
+# removes the least recently used entries until the cache fits in max_bytes
+def prune(cache_dir: Path, max_bytes: int) -> tuple[int, int]:
+    found = entries(cache_dir)
+    total = sum(size for _, size, _ in found)
+    removed = 0
+    removed_bytes = 0
+    for _, size, path in sorted(found):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        removed_bytes += size
+    with lock:
+        totals[cache_dir] = total
+    if removed:
+        logging.info(f"Source cache: pruned {removed} entries, {removed_bytes} bytes")
+    return removed, removed_bytes
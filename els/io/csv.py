@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import csv
 import io
+import mmap
 import os
+from collections import deque
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, BinaryIO, Optional, Union
 
 import pandas as pd
 
@@ -14,42 +17,133 @@ from .base import (
     ContainerWriterABC,
     FrameABC,
     multiindex_to_singleindex,
+    replacing_file,
 )
 
 if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+    from contextlib import AbstractContextManager
+
     from els._typing import FrameModeLiteral, IfExistsLiteral, KWArgsIO
 
 
+# decoded a line at a time, the file is never copied whole
+def csv_lines(csv_io: Union[io.BytesIO, mmap.mmap], start: int = 0) -> Iterator[str]:
+    csv_io.seek(start)
+    # TODO different encodings?
+    return (line.decode("utf-8") for line in iter(csv_io.readline, b""))
+
+
 def get_header_cell(
-    csv_io: io.BytesIO,
+    csv_io: Union[io.BytesIO, mmap.mmap],
     nrows: int,
     sep: str,
 ) -> str:
-    csv_io.seek(0)
-    # TODO different encodings?
-    # TODO better scope the sio io.StringIO object
-    sio = io.StringIO(csv_io.getvalue().decode("utf-8"))
-    reader = csv.reader(sio, delimiter=sep)
+    reader = csv.reader(csv_lines(csv_io), delimiter=sep)
     rows = [next(reader) for _ in range(nrows)]
     return str(rows)
 
 
+# read arguments that change how the lines of the file make its rows
+LINE_KWARGS = {
+    "comment",
+    "lineterminator",
+    "encoding",
+    "compression",
+    "skip_blank_lines",
+}
+FOOTER_BLOCK = 1 << 16
+
+
+# start of the last nrows lines, read back from the end of the file a block at
+# a time; None where they cannot be told apart from the rows by the bytes
+# alone: quoted, blank or the whole file
+def footer_offset(
+    csv_io: Union[io.BytesIO, mmap.mmap],
+    nrows: int,
+    quotechar: str = '"',
+) -> Optional[int]:
+    csv_io.seek(0, os.SEEK_END)
+    size = csv_io.tell()
+    # a line break ending the file does not start another line
+    end = size
+    for terminator in (b"\n", b"\r"):
+        if end > 0:
+            csv_io.seek(end - 1)
+            if csv_io.read(1) == terminator:
+                end -= 1
+    start, tail = end, b""
+    while start > 0 and tail.count(b"\n") < nrows:
+        block = min(FOOTER_BLOCK, start)
+        start -= block
+        csv_io.seek(start)
+        tail = csv_io.read(block) + tail
+    if tail.count(b"\n") < nrows:
+        return None
+    cut = len(tail)
+    for _ in range(nrows):
+        cut = tail.rindex(b"\n", 0, cut)
+    footer = tail[cut + 1 :]
+    if quotechar.encode() in footer or any(
+        not line.strip() for line in footer.split(b"\n")
+    ):
+        return None
+    return start + cut + 1
+
+
 def get_footer_cell(
-    csv_io: io.BytesIO,
+    csv_io: Union[io.BytesIO, mmap.mmap],
     nrows: int,
     sep: str,
+    quotechar: str = '"',
 ) -> str:
-    csv_io.seek(0)
-    # TODO different encodings?
-    # TODO better scope the sio io.StringIO object
-    sio = io.StringIO(csv_io.getvalue().decode("utf-8"))
-    reader = csv.reader(sio, delimiter=sep)
-    # TODO: read from end of file for performance
-    all_rows = list(reader)
-    rows = all_rows[-nrows:]
+    offset = footer_offset(csv_io, nrows, quotechar)
+    if offset is None:
+        reader = csv.reader(csv_lines(csv_io), delimiter=sep)
+        rows = list(deque(reader, maxlen=nrows))
+    else:
+        rows = list(csv.reader(csv_lines(csv_io, offset), delimiter=sep))
     return str(rows)
 
 
+# the bytes of a source up to end, read where they are rather than copied
+class BoundedReader(io.RawIOBase):
+    def __init__(self, csv_io: Union[io.BytesIO, mmap.mmap], end: int) -> None:
+        self.csv_io = csv_io
+        self.end = end
+        csv_io.seek(0)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.csv_io.read(max(0, min(len(buffer), self.end - self.csv_io.tell())))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+# the rows above the footer, for the C engine: skipfooter is only supported
+# by the python engine, which is left the files footer_offset cannot cut
+@contextmanager
+def footerless_source(
+    url: str,
+    kwargs: KWArgsIO,
+) -> Generator[tuple[Union[str, BinaryIO], KWArgsIO], None, None]:
+    if LINE_KWARGS & set(kwargs) or kwargs.get("engine", "c") != "c":
+        yield el.fetch_source(url), dict(kwargs, engine="python")
+        return
+    with el.open_source(url) as csv_io:
+        offset = footer_offset(
+            csv_io, kwargs["skipfooter"], kwargs.get("quotechar", '"')
+        )
+        if offset is None:
+            yield el.fetch_source(url), dict(kwargs, engine="python")
+        else:
+            kwargs = dict(kwargs)
+            del kwargs["skipfooter"]
+            yield io.BufferedReader(BoundedReader(csv_io, offset)), kwargs
+
+
 class CSVFrame(FrameABC):
     parent: CSVContainer  # for mypy
 
@@ -81,20 +175,23 @@ class CSVFrame(FrameABC):
         clean_last_column = kwargs.pop("clean_last_column", False)
         capture_header = kwargs.pop("capture_header", False)
         capture_footer = kwargs.pop("capture_footer", False)
-        if self.kwargs_pull != kwargs:
-            self.parent.file_io.seek(0)
+        if self.mode in ("s") or self.kwargs_pull != kwargs:
             if "iterator" in kwargs:
                 kwargs.pop("iterator")
             if "chunksize" in kwargs:
                 kwargs.pop("chunksize")
-            if "skipfooter" in kwargs:
-                kwargs["engine"] = "python"
-            self.df = pd.read_csv(
-                self.parent.file_io,
-                iterator=False,
-                chunksize=None,
-                **kwargs,
-            )
+            body: AbstractContextManager[tuple[Union[str, BinaryIO], KWArgsIO]]
+            if kwargs.get("skipfooter"):
+                body = footerless_source(self.parent.url, kwargs)
+            else:
+                body = nullcontext((self.parent.read_source, kwargs))
+            with body as (source, read_kwargs):
+                self.df = pd.read_csv(
+                    source,
+                    iterator=False,
+                    chunksize=None,
+                    **read_kwargs,
+                )
             # TODO: add tests
             if (
                 clean_last_column
@@ -106,26 +203,61 @@ class CSVFrame(FrameABC):
             skiprows = kwargs.get("skiprows", 0)
             if skiprows > 0 and capture_header:
                 if not self.header_cell:
-                    self.header_cell = get_header_cell(
-                        self.parent.file_io,
-                        nrows=skiprows,
-                        sep=kwargs.get("sep", ","),
-                    )
+                    with el.open_source(self.parent.url) as csv_io:
+                        self.header_cell = get_header_cell(
+                            csv_io,
+                            nrows=skiprows,
+                            sep=kwargs.get("sep", ","),
+                        )
                 self.df["_header"] = self.header_cell
 
             skipfooter = kwargs.get("skipfooter", 0)
             if skipfooter > 0 and capture_footer:
                 if not self.footer_cell:
-                    self.footer_cell = get_footer_cell(
-                        self.parent.file_io,
-                        nrows=skipfooter,
-                        sep=kwargs.get("sep", ","),
-                    )
+                    with el.open_source(self.parent.url) as csv_io:
+                        self.footer_cell = get_footer_cell(
+                            csv_io,
+                            nrows=skipfooter,
+                            sep=kwargs.get("sep", ","),
+                            quotechar=kwargs.get("quotechar", '"'),
+                        )
                 self.df["_footer"] = self.footer_cell
             self.kwargs_pull = kwargs
 
+    def read_chunks(self, kwargs: KWArgsIO) -> Generator[pd.DataFrame, None, None]:
+        if (
+            not kwargs.get("chunksize")
+            or kwargs.get("capture_header")
+            or kwargs.get("capture_footer")
+            or "skipfooter" in kwargs
+        ):
+            yield from super().read_chunks(kwargs)
+            return
+        kwargs.pop("iterator", None)
+        kwargs.pop("capture_header", None)
+        kwargs.pop("capture_footer", None)
+        clean_last_column = kwargs.pop("clean_last_column", False)
+        source = self.parent.read_source
+        drop_last_column: Optional[bool] = None
+        self.count_read()
+        with pd.read_csv(source, iterator=True, **kwargs) as reader:
+            for df in reader:
+                # decided on the first chunk, so all chunks have the same columns
+                if drop_last_column is None:
+                    drop_last_column = bool(
+                        clean_last_column
+                        and df.columns[-1].startswith("Unnamed")
+                        and df[df.columns[-1]].isnull().all()
+                    )
+                if drop_last_column:
+                    df = df.drop(df.columns[-1], axis=1)
+                yield df
+
 
 class CSVContainer(ContainerWriterABC[CSVFrame]):
+    persists_chunks = True
+    cacheable = True
+
     def __init__(
         self,
         url: str,
@@ -133,6 +265,10 @@ class CSVContainer(ContainerWriterABC[CSVFrame]):
     ) -> None:
         super().__init__(CSVFrame, url, replace)
 
+    @property
+    def read_source(self) -> Union[str, io.BytesIO]:
+        return el.fetch_source(self.url)
+
     @property
     def create_or_replace(self) -> bool:
         if self.replace or not os.path.isfile(self.url):
@@ -140,8 +276,25 @@ class CSVContainer(ContainerWriterABC[CSVFrame]):
         else:
             return False
 
+    # the header line only, the dtypes are left to the rows (object)
+    def _schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        kwargs = dict(kwargs)
+        for row_kwarg in ("nrows", "chunksize", "iterator"):
+            kwargs.pop(row_kwarg, None)
+        clean_last_column = kwargs.pop("clean_last_column", False)
+        capture_header = kwargs.pop("capture_header", False)
+        capture_footer = kwargs.pop("capture_footer", False)
+        skipfooter = kwargs.pop("skipfooter", 0)
+        df = pd.read_csv(self.read_source, nrows=0, **kwargs)
+        if clean_last_column and df.columns[-1].startswith("Unnamed"):
+            df = df.drop(df.columns[-1], axis=1)
+        if kwargs.get("skiprows", 0) > 0 and capture_header:
+            df["_header"] = pd.Series(dtype=object)
+        if skipfooter > 0 and capture_footer:
+            df["_footer"] = pd.Series(dtype=object)
+        return df
+
     def _children_init(self) -> None:
-        self.file_io = el.fetch_file_io(self.url, replace=self.create_or_replace)
         self.children = [
             CSVFrame(
                 name=Path(self.url).stem,
@@ -149,35 +302,36 @@ class CSVContainer(ContainerWriterABC[CSVFrame]):
             )
         ]
 
+    # written straight to disk, one chunk at a time: appends only add their
+    # rows to the end of the file, replacements are renamed over it
     def persist(self) -> None:
-        if self.mode in ("w", "a"):
-            self.file_io = el.fetch_file_io(self.url)
-            # loop not required, only one child in csv
-            for df_io in self:
-                if df_io.mode in ("a", "w"):
-                    df = df_io.df_target
-                    kwargs = df_io.kwargs_push
-                    # TODO integrate better into write method?
-                    if isinstance(df.columns, pd.MultiIndex):
-                        df = multiindex_to_singleindex(df)
-
-                    if df_io.if_exists == "truncate":
-                        #     df_io.mode = "w"
-                        self.file_io.seek(0)
-                    header = kwargs.pop("header", True if df_io.mode == "w" else False)
-                    assert df_io.mode == "w" or df_io.mode == "a"
-                    df.to_csv(
-                        self.file_io,
-                        index=False,
-                        mode=df_io.mode,
-                        header=header,
-                        **kwargs,
-                    )
-                    self.file_io.truncate()
-            with open(self.url, "wb") as write_file:
-                # self.file_io.seek(0)
-                write_file.write(self.file_io.getbuffer())
+        if self.mode not in ("w", "a"):
+            return
+        # loop not required, only one child in csv
+        for df_io in self:
+            if df_io.mode == "w":
+                with replacing_file(self.url) as temp_path:
+                    with open(temp_path, "wb") as write_file:
+                        self.write_chunks(df_io, write_file)
+            elif df_io.mode == "a":
+                with open(self.url, "ab") as write_file:
+                    self.write_chunks(df_io, write_file)
+
+    def write_chunks(self, df_io: CSVFrame, write_file: BinaryIO) -> None:
+        kwargs = df_io.kwargs_push
+        header = kwargs.pop("header", True if df_io.mode == "w" else False)
+        for df in df_io.target_chunks():
+            # TODO integrate better into write method?
+            if isinstance(df.columns, pd.MultiIndex):
+                df = multiindex_to_singleindex(df)
+            df.to_csv(
+                write_file,
+                index=False,
+                mode="wb" if df_io.mode == "w" else "ab",
+                header=header,
+                **kwargs,
+            )
+            header = False
 
     def close(self) -> None:
-        self.file_io.close()
-        del el.io_files[self.url]
+        pass  # not required / read from disk
@@ -8,6 +8,8 @@ import pandas as pd
 from .base import ContainerReaderABC, FrameABC
 
 if TYPE_CHECKING:
+    from collections.abc import Generator
+
     from els._typing import FrameModeLiteral, IfExistsLiteral, KWArgsIO
 
 
@@ -33,17 +35,29 @@ class FWFFrame(FrameABC):
         )
 
     def _read(self, kwargs: KWArgsIO) -> None:
-        if self.kwargs_pull != kwargs:
-            assert kwargs.pop("chunksize", None) is None
+        if self.mode in ("s") or self.kwargs_pull != kwargs:
+            # read in one piece, see read_chunks
+            kwargs.pop("chunksize", None)
             assert not kwargs.pop("iterator", False)
             self.df: pd.DataFrame = pd.read_fwf(
                 self.parent.url, chunksize=None, iterator=False, **kwargs
             )
             self.kwargs_pull = kwargs
 
+    def read_chunks(self, kwargs: KWArgsIO) -> Generator[pd.DataFrame, None, None]:
+        if not kwargs.get("chunksize"):
+            yield from super().read_chunks(kwargs)
+            return
+        assert not kwargs.pop("iterator", False)
+        self.count_read()
+        with pd.read_fwf(self.parent.url, iterator=True, **kwargs) as reader:
+            yield from reader
+
 
 class FWFContainer(ContainerReaderABC[FWFFrame]):
     # class FWFContainer(ContainerReaderABC):
+    cacheable = True
+
     def __init__(
         self,
         url: str,
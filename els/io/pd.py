@@ -4,9 +4,11 @@ from typing import TYPE_CHECKING
 
 import els.core as el
 
-from .base import ContainerWriterABC, FrameABC
+from .base import ContainerWriterABC, FrameABC, get_column_frame
 
 if TYPE_CHECKING:
+    import pandas as pd
+
     from els._typing import KWArgsIO
 
 
@@ -26,6 +28,10 @@ class DFContainer(ContainerWriterABC[DFFrame]):
     ):
         super().__init__(DFFrame, url, replace)
 
+    # in memory: read without copying, appends are written after its rows
+    def _schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        return get_column_frame(self[table].read(kwargs))
+
     def _children_init(self) -> None:
         self.df_dict = el.fetch_df_dict(self.url)
         for name in self.df_dict.keys():
@@ -125,7 +125,7 @@ class PDFFrame(FrameABC):
     # TODO test sample scenarios
     # TODO sample should not be optional since it is always called by super.read()
     def _read(self, kwargs: KWArgsIO) -> None:
-        if self.kwargs_pull != kwargs:
+        if self.mode in ("s") or self.kwargs_pull != kwargs:
             kw_copy = deepcopy(kwargs)
             laparams = None
             if "laparams" in kw_copy:
@@ -137,6 +137,8 @@ class PDFFrame(FrameABC):
 
 
 class PDFContainer(ContainerReaderABC[PDFFrame]):
+    cacheable = True
+
     def __init__(
         self,
         url: str,
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+# columns and dtypes of the target tables written by earlier runs, kept next
+# to the root config, enabled by execution.schema_registry: a table registered
+# is not probed again, see ContainerReaderABC.schema; entries are dropped when
+# they do not match a source, refresh ignores them all
+REGISTRY_NAME = ".els_schemas.json"
+
+path: Optional[Path] = None
+refresh = False
+tables: dict[str, dict[str, Any]] = {}
+lock = threading.Lock()
+
+
+def table_key(url: str, table: str) -> str:
+    return json.dumps([url, table])
+
+
+# a file changed since it was registered has its schema probed again
+def file_state(url: str) -> Optional[list[int]]:
+    if os.path.isfile(url):
+        stat = os.stat(url)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+def open_registry(registry_path: Path, refresh_all: bool = False) -> None:
+    global path, refresh
+    path, refresh = registry_path, refresh_all
+    with lock:
+        tables.clear()
+        if path.is_file():
+            with path.open() as file:
+                tables.update(json.load(file))
+
+
+def close_registry() -> None:
+    global path, refresh
+    if path is None:
+        return
+    temp_path = path.with_name(path.name + ".tmp")
+    with lock:
+        with temp_path.open("w") as file:
+            json.dump(tables, file, indent=1)
+        tables.clear()
+    os.replace(temp_path, path)
+    path, refresh = None, False
+
+
+def lookup(url: str, table: str) -> Optional[pd.DataFrame]:
+    if path is None or refresh:
+        return None
+    with lock:
+        entry = tables.get(table_key(url, table))
+    if entry is None or entry["file"] != file_state(url):
+        return None
+    return pd.DataFrame(
+        {column: pd.Series(dtype=dtype) for column, dtype in entry["columns"].items()}
+    )
+
+
+def registered(url: str, table: str) -> bool:
+    return lookup(url, table) is not None
+
+
+# once written
+def record(url: str, table: str, df: pd.DataFrame) -> None:
+    if path is None:
+        return
+    entry = dict(
+        columns={str(column): str(dtype) for column, dtype in df.dtypes.items()},
+        file=file_state(url),
+    )
+    with lock:
+        tables[table_key(url, table)] = entry
+
+
+def forget(url: str, table: Optional[str] = None) -> bool:
+    if path is None:
+        return False
+    with lock:
+        keys = [
+            key
+            for key in tables
+            if json.loads(key)[0] == url
+            and (table is None or json.loads(key)[1] == table)
+        ]
+        for key in keys:
+            del tables[key]
+    return bool(keys)
@@ -16,7 +16,7 @@ from els.sa_utils_patch import create_database, database_exists
 from .base import ContainerWriterABC, FrameABC
 
 if TYPE_CHECKING:
-    from collections.abc import MutableMapping
+    from collections.abc import Generator, MutableMapping
 
     from els._typing import FrameModeLiteral, IfExistsLiteral, KWArgsIO
 
@@ -49,6 +49,19 @@ def supported_available_odbc_drivers() -> set[str]:
     return supported.intersection(available)
 
 
+# the dtype pandas reads a column type as, object where it depends on the
+# values: nullable ints and bools are read as float64 or object once a row
+# holds a null
+def sql_dtype(sa_type: sa.types.TypeEngine[Any], nullable: bool = False) -> str:
+    try:
+        python_type = sa_type.python_type
+    except NotImplementedError:
+        return "object"
+    if nullable and python_type in (bool, int):
+        return "object"
+    return {bool: "bool", int: "int64", float: "float64"}.get(python_type, "object")
+
+
 def fetch_sa_engine(url: str, replace: bool = False) -> sa.Engine:
     dialect = sa.make_url(url).get_dialect().name
     driver = sa.make_url(url).get_driver_name()
@@ -124,23 +137,63 @@ class SQLFrame(FrameABC):
         )
         return self.if_exists
 
-    def _read(self, kwargs: KWArgsIO) -> None:
-        nrows = kwargs.pop("nrows", None)
+    def select_stmt(self, sqeng: sa.Connection, nrows: Optional[int]) -> sa.Select:
         if not self.parent.url:
             raise Exception("invalid db_connection_string")
         if not self.name:
             raise Exception("invalid sqn")
+        return (
+            sa.select(sa.text("*"))
+            .select_from(sa.text(f"{quote(sqeng, self.name)}"))
+            .limit(nrows)
+        )
+
+    def _read(self, kwargs: KWArgsIO) -> None:
+        nrows = kwargs.pop("nrows", None)
         with self.parent.sa_engine.connect() as sqeng:
+            stmt = self.select_stmt(sqeng, nrows)
+            # read in one piece, see read_chunks
+            kwargs.pop("chunksize", None)
+            self.df = pd.read_sql(stmt, con=sqeng, chunksize=None, **kwargs)
+
+    def read_chunks(self, kwargs: KWArgsIO) -> Generator[pd.DataFrame, None, None]:
+        if not kwargs.get("chunksize"):
+            yield from super().read_chunks(kwargs)
+            return
+        nrows = kwargs.pop("nrows", None)
+        self.count_read()
+        # server side cursor where supported, rows are fetched chunk by chunk
+        with self.parent.sa_engine.connect().execution_options(
+            stream_results=True
+        ) as sqeng:
+            stmt = self.select_stmt(sqeng, nrows)
+            yield from pd.read_sql(stmt, con=sqeng, **kwargs)
+
+    # from the statistics kept by the database, counting is as slow as reading
+    def row_estimate(self) -> Optional[int]:
+        if self.parent.dialect_name == "mssql":
             stmt = (
-                sa.select(sa.text("*"))
-                .select_from(sa.text(f"{quote(sqeng, self.name)}"))
-                .limit(nrows)
+                "select sum(rows) from sys.partitions "
+                "where object_id = object_id(:name) and index_id in (0, 1)"
             )
-            assert kwargs.pop("chunksize", None) is None
-            self.df = pd.read_sql(stmt, con=sqeng, chunksize=None, **kwargs)
+        elif self.parent.dialect_name == "duckdb":
+            stmt = "select estimated_size from duckdb_tables() where table_name = :name"
+        elif self.parent.dialect_name == "sqlite":
+            # rowid tables only, rows deleted since are still counted
+            stmt = f"select max(rowid) from {self.sqn}"
+        else:
+            return None
+        try:
+            with self.parent.sa_engine.connect() as sqeng:
+                res = sqeng.execute(sa.text(stmt), dict(name=self.name)).scalar()
+        except sa.exc.DBAPIError:
+            return None
+        return None if res is None else int(res)
 
 
 class SQLContainer(ContainerWriterABC[SQLFrame]):
+    persists_chunks = True
+
     def __init__(self, url: str, replace: bool = False):
         super().__init__(SQLFrame, url, replace)
 
@@ -261,6 +314,19 @@ class SQLContainer(ContainerWriterABC[SQLFrame]):
                 for n in inspector.get_table_names()
             ]
 
+    # from the column types, no rows are selected
+    def _schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        with self.sa_engine.connect() as sqeng:
+            columns = sa.inspect(sqeng).get_columns(table)
+        return pd.DataFrame(
+            {
+                column["name"]: pd.Series(
+                    dtype=sql_dtype(column["type"], column.get("nullable", True))
+                )
+                for column in columns
+            }
+        )
+
     @property
     def create_or_replace(self) -> bool:
         assert self.db_connection_string
@@ -286,16 +352,17 @@ class SQLContainer(ContainerWriterABC[SQLFrame]):
                     if df_io.if_exists == "truncate":
                         sqeng.execute(sa.text(df_io.truncate_stmt))
                         df_io.if_exists = "append"
-                    df_io.df_target.to_sql(
-                        df_io.name,
-                        sqeng,
-                        schema=None,
-                        index=False,
-                        if_exists=df_io.to_sql_if_exists,
-                        # method="multi",
-                        chunksize=1000,
-                        **kwargs,
-                    )
+                    for i, df in enumerate(df_io.target_chunks()):
+                        df.to_sql(
+                            df_io.name,
+                            sqeng,
+                            schema=None,
+                            index=False,
+                            if_exists=df_io.to_sql_if_exists if i == 0 else "append",
+                            # method="multi",
+                            chunksize=1000,
+                            **kwargs,
+                        )
             sqeng.connection.commit()
 
     def close(self) -> None:
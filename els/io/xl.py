@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+import datetime as dt
 import io
 import os
-from typing import TYPE_CHECKING, Any, Literal, Optional
+import shutil
+import zipfile
+from typing import TYPE_CHECKING, Any, Literal, Optional, Union
 
+import numpy as np
 import pandas as pd
+import xlsxwriter  # type:ignore
 from python_calamine import CalamineWorkbook, SheetTypeEnum, SheetVisibleEnum
+from xlsxwriter.utility import xl_pixel_width  # type:ignore
 
 import els.core as el
 
+from . import xlzip
 from .base import (
     ContainerWriterABC,
     FrameABC,
     multiindex_to_singleindex,
+    replacing_file,
 )
 
 if TYPE_CHECKING:
@@ -26,59 +34,243 @@ if TYPE_CHECKING:
 # TODO: add/test support for other workbook types
 
 
-def get_sheet_names(
-    xl_io: io.BytesIO,
-    sheet_states: list[SheetVisibleEnum] = [SheetVisibleEnum.Visible],
-) -> list[str]:
+# workbooks on disk are opened by path, not copied into memory first
+def open_workbook(xl_io: Union[str, io.BytesIO]) -> CalamineWorkbook:
+    if isinstance(xl_io, str):
+        return CalamineWorkbook.from_path(xl_io)
     xl_io.seek(0)
-    with CalamineWorkbook.from_filelike(xl_io) as workbook:
-        worksheet_names = [
-            sheet.name
-            for sheet in workbook.sheets_metadata
-            if (sheet.visible in sheet_states)
-            and (sheet.typ == SheetTypeEnum.WorkSheet)
-        ]
-        return worksheet_names
+    return CalamineWorkbook.from_filelike(xl_io)
 
 
-def get_sheet_row(
-    xl_io: io.BytesIO,
-    sheet_name: str,
-    row_index: int,
-) -> Optional[list[Any]]:
-    xl_io.seek(0)
-    with CalamineWorkbook.from_filelike(xl_io) as workbook:
-        if sheet_name in workbook.sheet_names:
-            return workbook.get_sheet_by_name(sheet_name).to_python(
-                nrows=row_index + 1
-            )[-1]
-        else:
-            return None
+# rows sizing the columns of the sheets written, see write_rows
+AUTOFIT_SAMPLE_ROWS = 1000
+AUTOFIT_MAX_PIXELS = 500
 
 
-def get_header_cell(
-    xl_io: io.BytesIO,
-    sheet_name: str,
-    nrows: int,
-) -> str:
-    xl_io.seek(0)
-    with CalamineWorkbook.from_filelike(xl_io) as wb:
-        rows = wb.get_sheet_by_name(sheet_name).to_python(
-            nrows=nrows,
-            skip_empty_area=False,
+# the header and missing cells as pandas formats them
+def sheet_formats(workbook: xlsxwriter.Workbook) -> dict[str, Any]:
+    return dict(
+        header=workbook.add_format(
+            {"bold": True, "border": 1, "align": "center", "valign": "top"}
+        ),
+        datetime=workbook.add_format({"num_format": xlzip.DATETIME_FORMAT}),
+        date=workbook.add_format({"num_format": xlzip.DATE_FORMAT}),
+        timedelta=workbook.add_format({"num_format": xlzip.TIMEDELTA_FORMAT}),
+    )
+
+
+# width of a cell as estimated by xlsxwriter's autofit
+def cell_pixels(value: Any) -> int:
+    value, kind = xlzip.excel_value(value)
+    if kind == "string":
+        return max(xl_pixel_width(line) for line in value.split("\n"))
+    elif kind in ("number", "timedelta"):
+        return 7 * len(str(value))
+    elif kind in ("datetime", "date"):
+        return 68
+    elif kind == "bool":
+        return 31 if value else 36
+    return 0
+
+
+def write_cell(
+    worksheet: Any,
+    row: int,
+    col: int,
+    value: Any,
+    formats: dict[str, Any],
+    cell_format: Any = None,
+) -> None:
+    value, kind = xlzip.excel_value(value)
+    if kind in ("datetime", "date"):
+        worksheet.write_datetime(row, col, value, cell_format or formats[kind])
+    elif kind == "number":
+        worksheet.write_number(row, col, value, cell_format)
+    elif kind == "timedelta":
+        worksheet.write_number(row, col, value, cell_format or formats[kind])
+    elif kind == "bool":
+        worksheet.write_boolean(row, col, value, cell_format)
+    elif kind == "string":
+        # formulas and urls as pandas writes them
+        worksheet.write(row, col, value, cell_format)
+
+
+# rows written in order, as constant_memory needs; the columns sized from the
+# header and the first rows rather than from every cell, as autofit would
+def write_rows(
+    workbook: xlsxwriter.Workbook,
+    name: str,
+    df: pd.DataFrame,
+    formats: dict[str, Any],
+) -> None:
+    worksheet = workbook.add_worksheet(name)
+    sample = df.head(AUTOFIT_SAMPLE_ROWS)
+    for col, column in enumerate(df.columns):
+        pixels = max(
+            [cell_pixels(column)] + [cell_pixels(v) for v in sample.iloc[:, col]]
         )
-        return str(rows)
+        if pixels:
+            worksheet.set_column_pixels(col, col, min(pixels + 7, AUTOFIT_MAX_PIXELS))
+    for col, column in enumerate(df.columns):
+        write_cell(worksheet, 0, col, column, formats, formats["header"])
+    for row, values in enumerate(df.itertuples(index=False, name=None), start=1):
+        for col, value in enumerate(values):
+            write_cell(worksheet, row, col, value, formats)
 
 
-def get_footer_cell(
-    xl_io: io.BytesIO,
-    sheet_name: str,
-    nrows: int,
-) -> str:
-    xl_io.seek(0)
-    with CalamineWorkbook.from_filelike(xl_io) as wb:
-        rows = wb.get_sheet_by_name(sheet_name).to_python()[-nrows:]
-        return str(rows)
+# read arguments XLContainer._schema takes the header row with
+XL_SCHEMA_KWARGS = {
+    "skiprows",
+    "skipfooter",
+    "capture_header",
+    "capture_footer",
+    "engine",
+    "nrows",
+}
+
+
+# column names as read_excel makes them from the header cells
+def header_names(row: list[Any]) -> list[Any]:
+    res: list[Any] = []
+    for i, cell in enumerate(row):
+        name: Any
+        if cell is None or cell == "":
+            name = f"Unnamed: {i}"
+        elif isinstance(cell, float) and cell.is_integer():
+            name = int(cell)
+        else:
+            name = cell
+        # duplicates are numbered: a, a.1, a.2
+        dup, count = name, 0
+        while dup in res:
+            count += 1
+            dup = f"{name}.{count}"
+        res.append(dup)
+    return res
+
+
+# read arguments grid_frame builds the columns with
+GRID_KWARGS = {"skiprows", "nrows", "skipfooter", "usecols", "names", "header"}
+BOOL_STRINGS = {"True", "TRUE", "true", "False", "FALSE", "false"}
+# read_excel's default na_values
+NA_STRINGS = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+NUMBER_STARTS = set("0123456789+-. iInN")
+
+
+# strings pandas would read as numbers, booleans or missing values
+def converted_string(value: str) -> bool:
+    if value in NA_STRINGS or value in BOOL_STRINGS:
+        return True
+    elif value[0] in NUMBER_STARTS:
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+# a column typed as read_excel types it, None where it would convert its cells
+def grid_column(values: tuple[Any, ...]) -> Optional[Any]:
+    present = [value for value in values if value != ""]
+    if not present:
+        return None
+    missing = len(present) < len(values)
+    types = {type(value) for value in present}
+    if types <= {float, int}:
+        res = np.array([np.nan if v == "" else v for v in values], dtype="float64")
+        if not np.isfinite(res[~np.isnan(res)]).all() or np.abs(res).max() >= 2**53:
+            return None
+        elif missing or (res % 1).any():
+            return res
+        return res.astype("int64")
+    elif types == {bool} and not missing:
+        return np.array(values, dtype="bool")
+    elif types <= {dt.datetime, dt.date}:
+        return pd.DatetimeIndex([pd.NaT if v == "" else v for v in values]).to_numpy()
+    elif types == {str} and not any(converted_string(v) for v in present):
+        return np.array([np.nan if v == "" else v for v in values], dtype="object")
+    return None
+
+
+# the frame built column by column from the cells calamine decoded, rather
+# than row by row through read_excel's parser; None where the read arguments
+# or the cells need the parser
+def grid_frame(rows: list[list[Any]], kwargs: KWArgsIO) -> Optional[pd.DataFrame]:
+    skiprows = kwargs.get("skiprows", 0)
+    nrows = kwargs.get("nrows")
+    skipfooter = kwargs.get("skipfooter", 0)
+    header = kwargs.get("header", 0)
+    usecols = kwargs.get("usecols")
+    names = kwargs.get("names")
+    if (
+        set(kwargs) - GRID_KWARGS
+        or not isinstance(skiprows, int)
+        or not isinstance(skipfooter, int)
+        or header not in (0, None)
+        or not (nrows is None or isinstance(nrows, int))
+        or not (usecols is None or isinstance(usecols, list))
+        or not (names is None or isinstance(names, list))
+    ):
+        return None
+    rows = rows[skiprows:]
+    # blank rows are skipped by the parser
+    if not rows or any(all(cell == "" for cell in row) for row in rows):
+        return None
+    if header == 0:
+        # names are numbered by read_excel as it formats the cells
+        if not all(isinstance(cell, str) for cell in rows[0]):
+            return None
+        columns = header_names(rows[0])
+        rows = rows[1:]
+    else:
+        columns = list(range(len(rows[0])))
+    if skipfooter:
+        rows = rows[:-skipfooter]
+    if nrows is not None:
+        rows = rows[:nrows]
+    if names is not None:
+        if len(names) != len(columns) or len(set(names)) != len(names):
+            return None
+        columns = names
+    positions = list(range(len(columns)))
+    if usecols is not None:
+        if all(isinstance(col, int) for col in usecols):
+            positions = sorted(set(usecols) & set(positions))
+        elif all(col in columns for col in usecols):
+            positions = [i for i, col in enumerate(columns) if col in usecols]
+        else:
+            return None
+    if not rows:
+        return None
+    data = {}
+    cells = list(zip(*rows))
+    for i in positions:
+        column = grid_column(cells[i])
+        if column is None:
+            return None
+        data[columns[i]] = column
+    return pd.DataFrame(data)
 
 
 # class XLFrame(FrameABC["XLContainer"]):
@@ -93,7 +285,7 @@ class XLFrame(FrameABC):
         if_exists: IfExistsLiteral = "fail",
         mode: FrameModeLiteral = "s",
         df: pd.DataFrame = pd.DataFrame(),
-        startrow: int = 0,
+        startrow: Optional[int] = None,
         kwargs_pull: Optional[KWArgsIO] = None,
         kwargs_push: Optional[KWArgsIO] = None,
     ) -> None:
@@ -126,45 +318,60 @@ class XLFrame(FrameABC):
             # kwargs_push['skiprows']
             # TODO: test skiprow and truncate combinations
             return 0
-        else:
-            return self._startrow
+        elif self._startrow is None:
+            # found on the first append, the sheet is not loaded otherwise
+            self._startrow = self.parent.sheet_height(self.name) or 1
+        return self._startrow
 
     @startrow.setter
     def startrow(self, v: int) -> None:
         self._startrow = v
 
+    # read whole, its cells are not decoded again: the grid is let go
+    def read(
+        self,
+        kwargs: Optional[KWArgsIO] = None,
+        sample: bool = False,
+    ) -> pd.DataFrame:
+        with self.parent.lock:
+            df = super().read(kwargs, sample)
+            if self.mode == "r":
+                self.parent.release_grid(self.name)
+            return df
+
     def _read(self, kwargs: KWArgsIO) -> None:
         if kwargs.get("nrows") and kwargs.get("skipfooter"):
             del kwargs["nrows"]
         capture_header = kwargs.pop("capture_header", False)
         capture_footer = kwargs.pop("capture_footer", False)
-        if self.kwargs_pull != kwargs:
+        if self.mode in ("s") or self.kwargs_pull != kwargs:
             sheet_name = kwargs.pop("sheet_name", self.name)
             assert isinstance(sheet_name, str)
-            self.df = pd.read_excel(
-                self.parent.file_io,
-                engine=kwargs.pop("engine", "calamine"),
-                sheet_name=sheet_name,
-                **kwargs,
-            )
+            engine = kwargs.pop("engine", "calamine")
+            df = None
+            if engine == "calamine":
+                df = grid_frame(self.parent.grid(sheet_name), kwargs)
+            if df is None:
+                # read_excel's parser decodes the sheet again
+                df = pd.read_excel(
+                    self.parent.read_source,
+                    engine=engine,
+                    sheet_name=sheet_name,
+                    **kwargs,
+                )
+            self.df = df
             skiprows = kwargs.get("skiprows", 0)
             assert self.name
             if skiprows > 0 and capture_header:
                 if self.header_cell is None:
-                    self.header_cell = get_header_cell(
-                        self.parent.file_io,
-                        self.name,
-                        nrows=skiprows,
-                    )
+                    self.header_cell = str(self.parent.grid(self.name)[:skiprows])
                 self.df["_header"] = self.header_cell
 
             skipfooter = kwargs.get("skipfooter", 0)
             if skipfooter > 0 and capture_footer:
                 if self.footer_cell is None:
-                    self.footer_cell = get_footer_cell(
-                        self.parent.file_io,
-                        self.name,
-                        nrows=skipfooter,
+                    self.footer_cell = str(
+                        self.parent.used_rows(self.name)[-skipfooter:]
                     )
                 self.df["_footer"] = self.footer_cell
 
@@ -172,11 +379,20 @@ class XLFrame(FrameABC):
 
 
 class XLContainer(ContainerWriterABC[XLFrame]):
+    cacheable = True
+
     def __init__(
         self,
         url: str,
         replace: bool = False,
     ):
+        # opened once for all the reads, see workbook
+        self._workbook: Optional[CalamineWorkbook] = None
+        # rows of each sheet from its first row and column, as read_excel
+        # sees them, and where the cells used start; kept until the sheet's
+        # frame is read whole
+        self.grids: dict[str, list[list[Any]]] = {}
+        self.grid_starts: dict[str, Optional[tuple[int, int]]] = {}
         super().__init__(XLFrame, url, replace)
 
     @property
@@ -193,25 +409,97 @@ class XLContainer(ContainerWriterABC[XLFrame]):
         else:
             return "xlsxwriter"
 
+    # workbooks are only loaded into memory once written by the run
+    @property
+    def read_source(self) -> Union[str, io.BytesIO]:
+        return el.fetch_source(self.url)
+
+    @property
+    def workbook(self) -> CalamineWorkbook:
+        if self._workbook is None:
+            self._workbook = open_workbook(self.read_source)
+        return self._workbook
+
+    def grid(self, sheet_name: str) -> list[list[Any]]:
+        if sheet_name not in self.grids:
+            sheet = self.workbook.get_sheet_by_name(sheet_name)
+            self.grids[sheet_name] = sheet.to_python(skip_empty_area=False)
+            self.grid_starts[sheet_name] = sheet.start
+        return self.grids[sheet_name]
+
+    # rows up to the last cell used, the sheet is not decoded for it
+    def sheet_height(self, sheet_name: str) -> int:
+        if sheet_name in self.grids:
+            return len(self.grids[sheet_name])
+        end = self.workbook.get_sheet_by_name(sheet_name).end
+        return 0 if end is None else end[0] + 1
+
+    # without the empty rows and columns before the cells used
+    def used_rows(self, sheet_name: str) -> list[list[Any]]:
+        rows = self.grid(sheet_name)
+        start = self.grid_starts[sheet_name]
+        if start is None:
+            return []
+        return [row[start[1] :] for row in rows[start[0] :]]
+
+    def release_grid(self, sheet_name: str) -> None:
+        self.grids.pop(sheet_name, None)
+        self.grid_starts.pop(sheet_name, None)
+
+    # written over or closed: opened again by the next read
+    def release_workbook(self) -> None:
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        self.grids.clear()
+        self.grid_starts.clear()
+
+    # the header row only, of the one sheet; object dtypes as for csv
+    def _schema(self, table: str, kwargs: KWArgsIO) -> pd.DataFrame:
+        skiprows = kwargs.get("skiprows", 0)
+        if not isinstance(skiprows, int) or set(kwargs) - XL_SCHEMA_KWARGS:
+            # header, usecols, names...: as read by pandas
+            return super()._schema(table, kwargs)
+        rows = self.grid(table)
+        row = rows[skiprows] if len(rows) > skiprows else []
+        df = pd.DataFrame(columns=header_names(row), dtype=object)
+        if skiprows > 0 and kwargs.get("capture_header"):
+            df["_header"] = pd.Series(dtype=object)
+        if kwargs.get("skipfooter", 0) > 0 and kwargs.get("capture_footer"):
+            df["_footer"] = pd.Series(dtype=object)
+        return df
+
+    # from the workbook metadata, no sheet is loaded
     def _children_init(self) -> None:
-        self.file_io = el.fetch_file_io(self.url)
-        with CalamineWorkbook.from_filelike(self.file_io) as workbook:
-            self.children = [
-                XLFrame(
-                    startrow=workbook.get_sheet_by_name(sheet.name).total_height + 1,
-                    name=sheet.name,
-                    parent=self,
-                )
-                for sheet in workbook.sheets_metadata
-                if (sheet.visible in [SheetVisibleEnum.Visible])
-                and (sheet.typ == SheetTypeEnum.WorkSheet)
-            ]
+        self.children = [
+            XLFrame(name=sheet.name, parent=self)
+            for sheet in self.workbook.sheets_metadata
+            if (sheet.visible in [SheetVisibleEnum.Visible])
+            and (sheet.typ == SheetTypeEnum.WorkSheet)
+        ]
 
+    # written to a copy of the workbook, renamed over it once complete
     def persist(self) -> None:
-        if self.mode == "w":
-            self.file_io = el.fetch_file_io(self.url, replace=True)
+        if self.mode not in ("w", "a"):
+            return
+        with replacing_file(self.url) as temp_path:
+            self.persist_to(temp_path)
+        self.release_workbook()
+
+    def persist_to(self, path: str) -> None:
+        if self.mode == "w" and not any(df_io.kwargs_push for df_io in self):
+            # a row at a time, rows are not kept by the workbook
+            with xlsxwriter.Workbook(path, {"constant_memory": True}) as workbook:
+                formats = sheet_formats(workbook)
+                for df_io in self:
+                    df = df_io.df_target
+                    if isinstance(df.columns, pd.MultiIndex):
+                        df = multiindex_to_singleindex(df)
+                    write_rows(workbook, df_io.name, df, formats)
+        elif self.mode == "w":
+            # write_args are passed to pandas
             with pd.ExcelWriter(
-                self.file_io, engine=self.write_engine, mode=self.mode
+                path, engine=self.write_engine, mode=self.mode
             ) as writer:
                 for df_io in self:
                     df = df_io.df_target
@@ -228,13 +516,32 @@ class XLContainer(ContainerWriterABC[XLFrame]):
                 for sheet in writer.sheets.values():
                     sheet.autofit(500)
         elif self.mode == "a":
+            # sheets written whole are spliced into the workbook, which is
+            # not loaded, see xlzip; the sheets appended to are loaded
+            spliced: set[str] = set()
+            sheets = {
+                df_io.name: df_io.df_target
+                for df_io in self
+                if df_io.mode == "w" and not df_io.kwargs_push
+            }
+            for name, df in sheets.items():
+                if isinstance(df.columns, pd.MultiIndex):
+                    sheets[name] = multiindex_to_singleindex(df)
+            try:
+                if sheets:
+                    xlzip.splice_sheets(self.url, path, sheets)
+                    spliced = set(sheets)
+            except (xlzip.SpliceError, zipfile.BadZipFile):
+                pass
+            if not spliced:
+                shutil.copyfile(self.url, path)
             sheet_exists: set[IfSheetExistsLiteral] = set()
             for df_io in self:
-                if df_io.mode not in ("r", "s"):
+                if df_io.mode not in ("r", "s") and df_io.name not in spliced:
                     sheet_exists.add(df_io.if_sheet_exists)
             for sheet_exist in sheet_exists:
                 with pd.ExcelWriter(
-                    self.file_io,
+                    path,
                     engine=self.write_engine,
                     mode=self.mode,
                     if_sheet_exists=sheet_exist,
@@ -242,6 +549,7 @@ class XLContainer(ContainerWriterABC[XLFrame]):
                     for df_io in self:
                         if (
                             df_io.mode not in ("r", "s")
+                            and df_io.name not in spliced
                             and df_io.if_sheet_exists == sheet_exist
                         ):
                             df = df_io.df_target
@@ -261,11 +569,6 @@ class XLContainer(ContainerWriterABC[XLFrame]):
                                 startrow=df_io.startrow,
                                 **kwargs,
                             )
-        # TODO: should this be nested? Ensuring mode is a or w
-        with open(self.url, "wb") as write_file:
-            self.file_io.seek(0)
-            write_file.write(self.file_io.getbuffer())
 
     def close(self) -> None:
-        self.file_io.close()
-        del el.io_files[self.url]
+        self.release_workbook()
@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import copy
+import datetime as dt
+import html
+import posixpath
+import re
+import struct
+import zipfile
+from typing import TYPE_CHECKING, Any
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+# sheets added to or replacing sheets of an xlsx workbook without loading it:
+# the new sheets are written as xml parts, the workbook, its relationships,
+# content types and styles are edited as text, every other part of the zip
+# is copied byte-for-byte, compressed as it is
+
+WORKBOOK = "xl/workbook.xml"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+CONTENT_TYPES = "[Content_Types].xml"
+STYLES = "xl/styles.xml"
+CALC_CHAIN = "xl/calcChain.xml"
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_TYPE = REL_NS + "/worksheet"
+WORKSHEET_CONTENT_TYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+)
+SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+)
+
+# as pandas writes them
+HEADER_FONT_BOLD = "<b/>"
+HEADER_BORDER = (
+    "<border>"
+    + "".join(
+        f'<{side} style="thin"><color auto="1"/></{side}>'
+        for side in ("left", "right", "top", "bottom")
+    )
+    + "<diagonal/></border>"
+)
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+DATE_FORMAT = "YYYY-MM-DD"
+# days, the number format 1 built into Excel
+TIMEDELTA_FORMAT = "0"
+
+ILLEGAL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# sheet names as Excel takes them, compared regardless of case
+SHEET_NAME_CHARS = re.compile(r"[\[\]:*?/\\]")
+SHEET_NAME_LENGTH = 31
+
+
+# a workbook or sheet name not edited as text, left to openpyxl
+class SpliceError(Exception):
+    pass
+
+
+def check_sheet_name(name: str) -> None:
+    if not name or len(name) > SHEET_NAME_LENGTH or SHEET_NAME_CHARS.search(name):
+        raise SpliceError(f"{name!r} is not a valid sheet name")
+
+
+def column_letter(index: int) -> str:
+    res = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        res = chr(65 + remainder) + res
+    return res
+
+
+def attributes(tag: str) -> dict[str, str]:
+    return {
+        key: html.unescape(value)
+        for key, value in re.findall(r'([\w:]+)="([^"]*)"', tag)
+    }
+
+
+def part_path(target: str) -> str:
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join("xl", target))
+
+
+class SheetStyles:
+    # cellXfs indices of the header, datetime, date and timedelta cells,
+    # appended to the workbook's styles
+    def __init__(self, styles: str) -> None:
+        self.xml = styles
+        if "<cellXfs" not in styles or "<fonts" not in styles:
+            raise SpliceError("styles not found")
+
+        fonts = self.section("fonts")
+        first_font = re.search(
+            r"<font\b[^>]*?/>|<font\b[^>]*>.*?</font>", fonts, re.DOTALL
+        )
+        if first_font is None:
+            raise SpliceError("default font not found")
+        font = first_font.group()
+        if font.endswith("/>"):
+            font = font[:-2] + ">"
+        else:
+            font = font[: -len("</font>")]
+        font_id = self.append("fonts", "font", [font + HEADER_FONT_BOLD + "</font>"])
+        border_id = self.append("borders", "border", [HEADER_BORDER])
+
+        ids = [int(i) for i in re.findall(r'numFmtId="(\d+)"', self.section("numFmts"))]
+        datetime_id = max([163, *ids]) + 1
+        self.append(
+            "numFmts",
+            "numFmt",
+            [
+                f'<numFmt numFmtId="{datetime_id}" formatCode="{DATETIME_FORMAT}"/>',
+                f'<numFmt numFmtId="{datetime_id + 1}" formatCode="{DATE_FORMAT}"/>',
+            ],
+        )
+        self.header = self.append(
+            "cellXfs",
+            "xf",
+            [
+                (
+                    f'<xf numFmtId="0" fontId="{font_id}" fillId="0" '
+                    f'borderId="{border_id}" xfId="0" applyFont="1" applyBorder="1" '
+                    'applyAlignment="1"><alignment horizontal="center" '
+                    'vertical="top"/></xf>'
+                ),
+                (
+                    f'<xf numFmtId="{datetime_id}" fontId="0" fillId="0" borderId="0" '
+                    'xfId="0" applyNumberFormat="1"/>'
+                ),
+                (
+                    f'<xf numFmtId="{datetime_id + 1}" fontId="0" fillId="0" '
+                    'borderId="0" xfId="0" applyNumberFormat="1"/>'
+                ),
+                (
+                    '<xf numFmtId="1" fontId="0" fillId="0" borderId="0" xfId="0" '
+                    'applyNumberFormat="1"/>'
+                ),
+            ],
+        )
+        self.datetime = self.header + 1
+        self.date = self.header + 2
+        self.timedelta = self.header + 3
+
+    def section(self, tag: str) -> str:
+        match = re.search(rf"<{tag}\b[^>]*>(.*?)</{tag}>", self.xml, re.DOTALL)
+        return match.group(1) if match else ""
+
+    # index of the first child appended
+    def append(self, tag: str, child: str, children: list[str]) -> int:
+        match = re.search(rf"<{tag}\b[^>]*?(/?)>", self.xml)
+        if match is None:
+            if tag != "numFmts":
+                raise SpliceError(f"{tag} not found")
+            # the first element of the stylesheet
+            root = re.search(r"<styleSheet\b[^>]*>", self.xml)
+            assert root is not None
+            start = end = root.end()
+            body = ""
+        elif match.group(1):
+            start, end = match.span()
+            body = ""
+        else:
+            start = match.start()
+            end = self.xml.index(f"</{tag}>", match.end()) + len(f"</{tag}>")
+            body = self.xml[match.end() : end - len(f"</{tag}>")]
+        count = len(re.findall(rf"<{child}\b", body))
+        body += "".join(children)
+        section = f'<{tag} count="{count + len(children)}">{body}</{tag}>'
+        self.xml = self.xml[:start] + section + self.xml[end:]
+        return count
+
+
+EPOCH = pd.Timestamp("1899-12-30")
+
+
+# days from 1899-12-30, less one before 1900-03-01: Excel counts 1900-02-29
+def excel_serial(serial: float) -> float:
+    if serial < 61:
+        serial -= 1
+    return serial
+
+
+# the value as pandas writes it, and its kind: "" when the cell is left empty
+def excel_value(value: Any) -> tuple[Any, str]:
+    if (
+        value is None
+        or (pd.api.types.is_scalar(value) and pd.isna(value))
+        or (isinstance(value, str) and not value)
+    ):
+        return None, ""
+    elif isinstance(value, (bool, np.bool_)):
+        return bool(value), "bool"
+    elif isinstance(value, (int, np.integer)):
+        return int(value), "number"
+    elif isinstance(value, (float, np.floating)):
+        if np.isinf(value):
+            return ("inf" if value > 0 else "-inf"), "string"
+        return float(value), "number"
+    elif isinstance(value, dt.datetime):
+        if value.tzinfo is not None:
+            raise ValueError(
+                "Excel does not support datetimes with timezones. Please ensure "
+                "that datetimes are timezone unaware before writing to Excel."
+            )
+        return value, "datetime"
+    elif isinstance(value, dt.date):
+        return value, "date"
+    elif isinstance(value, dt.timedelta):
+        return value / dt.timedelta(days=1), "timedelta"
+    return str(value), "string"
+
+
+def cell_xml(ref: str, value: Any, style: int, styles: SheetStyles) -> str:
+    value, kind = excel_value(value)
+    if kind == "datetime":
+        style = style or styles.datetime
+        value = excel_serial((pd.Timestamp(value) - EPOCH) / pd.Timedelta(days=1))
+    elif kind == "date":
+        style = style or styles.date
+        value = excel_serial((value - EPOCH.date()).days)
+    elif kind == "timedelta":
+        style = style or styles.timedelta
+    attrs = f' r="{ref}"' + (f' s="{style}"' if style else "")
+    if not kind:
+        return ""
+    elif kind == "bool":
+        return f'<c{attrs} t="b"><v>{int(value)}</v></c>'
+    elif kind != "string":
+        number = repr(value) if isinstance(value, float) else str(value)
+        return f"<c{attrs}><v>{number}</v></c>"
+    text = ILLEGAL_CHARS.sub(lambda m: f"_x{ord(m.group()):04X}_", value)
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c{attrs} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def sheet_parts(
+    df: pd.DataFrame,
+    styles: SheetStyles,
+) -> Generator[bytes, None, None]:
+    nrows, ncols = df.shape
+    last = f"{column_letter(max(ncols - 1, 0))}{nrows + 1}"
+    yield f'{SHEET_HEAD}<dimension ref="A1:{last}"/><sheetData>'.encode()
+    letters = [column_letter(i) for i in range(ncols)]
+    header = "".join(
+        cell_xml(f"{letter}1", name, styles.header, styles)
+        for letter, name in zip(letters, df.columns)
+    )
+    yield f'<row r="1">{header}</row>'.encode()
+    for i, row in enumerate(df.itertuples(index=False, name=None), start=2):
+        cells = "".join(
+            cell_xml(f"{letter}{i}", value, 0, styles)
+            for letter, value in zip(letters, row)
+        )
+        yield f'<row r="{i}">{cells}</row>'.encode()
+    yield b"</sheetData></worksheet>"
+
+
+# the compressed bytes of an entry, copied without being inflated again
+def copy_entry(
+    source: zipfile.ZipFile,
+    target: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+) -> None:
+    assert source.fp is not None and target.fp is not None
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(30)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(info.header_offset + 30 + name_length + extra_length)
+    res = copy.copy(info)
+    # sizes in the header rather than in a trailing data descriptor
+    res.flag_bits &= ~0x08
+    res.header_offset = target.fp.tell()
+    target.fp.write(res.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        block = source.fp.read(min(remaining, 1024 * 1024))
+        target.fp.write(block)
+        remaining -= len(block)
+    target.filelist.append(res)
+    target.NameToInfo[res.filename] = res
+    target.start_dir = target.fp.tell()
+    target._didModify = True  # type:ignore
+
+
+def splice_sheets(
+    source_path: str,
+    target_path: str,
+    sheets: dict[str, pd.DataFrame],
+) -> None:
+    with zipfile.ZipFile(source_path) as source:
+        names = set(source.namelist())
+        try:
+            workbook = source.read(WORKBOOK).decode()
+            rels = source.read(WORKBOOK_RELS).decode()
+            content_types = source.read(CONTENT_TYPES).decode()
+            styles = SheetStyles(source.read(STYLES).decode())
+            if "<sheets" not in workbook or re.search(r'date1904="(1|true)"', workbook):
+                raise SpliceError("workbook layout not supported")
+
+            targets = {
+                attrs["Id"]: part_path(attrs["Target"])
+                for attrs in map(attributes, re.findall(r"<Relationship\b[^>]*>", rels))
+            }
+            parts: dict[str, str] = {}
+            sheet_ids = [0]
+            for attrs in map(attributes, re.findall(r"<sheet\b[^>]*>", workbook)):
+                sheet_ids.append(int(attrs.get("sheetId", 0)))
+                rel_id = next(v for k, v in attrs.items() if k.endswith(":id"))
+                parts[attrs["name"]] = targets[rel_id]
+        except (KeyError, StopIteration, ValueError) as e:
+            raise SpliceError("workbook parts not found") from e
+
+        replaced: dict[str, str] = {}
+        added: dict[str, str] = {}
+        folded = {name.casefold(): name for name in parts}
+        rel_ids = [int(i) for i in re.findall(r'Id="rId(\d+)"', rels)] or [0]
+        for name in sheets:
+            check_sheet_name(name)
+            if folded.setdefault(name.casefold(), name) != name:
+                raise SpliceError(f"{name} differs from a sheet in case only")
+            if name in parts:
+                if (
+                    f'PartName="/{parts[name]}" ContentType="{WORKSHEET_CONTENT_TYPE}"'
+                    not in content_types
+                ):
+                    raise SpliceError(f"{name} is not a worksheet")
+                replaced[parts[name]] = name
+                continue
+            number = len(parts) + len(added) + 1
+            while f"xl/worksheets/sheet{number}.xml" in names:
+                number += 1
+            part = f"xl/worksheets/sheet{number}.xml"
+            names.add(part)
+            added[part] = name
+            rel_id = f"rId{max(rel_ids) + 1}"
+            rel_ids.append(max(rel_ids) + 1)
+            sheet_ids.append(max(sheet_ids) + 1)
+            workbook = workbook.replace(
+                "</sheets>",
+                f'<sheet xmlns:r="{REL_NS}" name={quoteattr(name)} '
+                f'sheetId="{sheet_ids[-1]}" r:id="{rel_id}"/></sheets>',
+            )
+            rels = rels.replace(
+                "</Relationships>",
+                f'<Relationship Id="{rel_id}" Type="{WORKSHEET_TYPE}" '
+                f'Target="/{part}"/></Relationships>',
+            )
+            content_types = content_types.replace(
+                "</Types>",
+                f'<Override PartName="/{part}" '
+                f'ContentType="{WORKSHEET_CONTENT_TYPE}"/></Types>',
+            )
+
+        dropped: set[str] = set()
+        if replaced:
+            # their drawings, comments and tables are not kept
+            dropped |= {
+                posixpath.join(
+                    posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels"
+                )
+                for part in replaced
+            }
+            # formulas of the replaced sheets, rebuilt by Excel
+            dropped.add(CALC_CHAIN)
+            rels = re.sub(r"<Relationship\b[^>]*calcChain[^>]*>", "", rels)
+            content_types = re.sub(
+                r"<Override\b[^>]*calcChain[^>]*>", "", content_types
+            )
+        edited = {
+            WORKBOOK: workbook,
+            WORKBOOK_RELS: rels,
+            CONTENT_TYPES: content_types,
+        }
+
+        with zipfile.ZipFile(
+            target_path, "w", compression=zipfile.ZIP_DEFLATED
+        ) as target:
+            for info in source.infolist():
+                if info.filename in dropped:
+                    continue
+                elif info.filename == STYLES:
+                    target.writestr(info.filename, styles.xml)
+                elif info.filename in edited:
+                    target.writestr(info.filename, edited[info.filename])
+                elif info.filename in replaced:
+                    write_sheet(
+                        target, info.filename, sheets[replaced[info.filename]], styles
+                    )
+                else:
+                    copy_entry(source, target, info)
+            for part, name in added.items():
+                write_sheet(target, part, sheets[name], styles)
+
+
+def write_sheet(
+    target: zipfile.ZipFile,
+    part: str,
+    df: pd.DataFrame,
+    styles: SheetStyles,
+) -> None:
+    with target.open(part, "w", force_zip64=True) as file:
+        for chunk in sheet_parts(df, styles):
+            file.write(chunk)
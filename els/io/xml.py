@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 import os
-from io import StringIO
+from io import BytesIO
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Union
 
 import pandas as pd
 
@@ -14,6 +14,7 @@ from .base import (
     FrameABC,
     append_into,
     get_column_frame,
+    replacing_file,
 )
 
 if TYPE_CHECKING:
@@ -51,14 +52,13 @@ class XMLFrame(FrameABC):
         if self.mode in ("s") or (self.kwargs_pull != kwargs):
             if "nrows" in kwargs:
                 kwargs.pop("nrows")
-            self.parent.file_io.seek(0)
-            self.df = pd.read_xml(
-                StringIO(self.parent.file_io.getvalue().decode("utf-8")), **kwargs
-            )
+            self.df = pd.read_xml(self.parent.read_source, **kwargs)
             self.kwargs_pull = kwargs
 
 
 class XMLContainer(ContainerWriterABC[XMLFrame]):
+    cacheable = True
+
     def __init__(
         self,
         url: str,
@@ -73,8 +73,12 @@ class XMLContainer(ContainerWriterABC[XMLFrame]):
         else:
             return False
 
+    # files are only loaded into memory once written by the run
+    @property
+    def read_source(self) -> Union[str, BytesIO]:
+        return el.fetch_source(self.url)
+
     def _children_init(self) -> None:
-        self.file_io = el.fetch_file_io(self.url, replace=False)
         self.children = [
             XMLFrame(
                 name=Path(self.url).stem,
@@ -82,9 +86,9 @@ class XMLContainer(ContainerWriterABC[XMLFrame]):
             )
         ]
 
+    # the whole document is rewritten, renamed over the file once complete
     def persist(self) -> None:
         if self.mode in ("w", "a"):
-            self.file_io = el.fetch_file_io(self.url)
             # loop not required, only one child in XML
             for df_io in self:
                 df = df_io.df_target
@@ -92,30 +96,21 @@ class XMLContainer(ContainerWriterABC[XMLFrame]):
                 # TODO: relevant for XML?
                 # if isinstance(df.columns, pd.MultiIndex):
                 #     df = multiindex_to_singleindex(df)
+                exists = os.path.isfile(self.url) and os.path.getsize(self.url) > 0
                 if df_io.if_exists == "truncate":
-                    self.file_io.seek(0)
-                    stringit = StringIO(self.file_io.getvalue().decode("utf-8"))
-                    for_append = pd.read_xml(stringit)
-                    self.file_io.seek(0)
+                    for_append = pd.read_xml(self.url)
                     df = append_into([get_column_frame(for_append), df])
 
-                if df_io.if_exists == "append" and len(self.file_io.getbuffer()):
-                    self.file_io.seek(0)
-                    stringit = StringIO(self.file_io.getvalue().decode("utf-8"))
-                    for_append = pd.read_xml(stringit)
-                    self.file_io.seek(0)
+                if df_io.if_exists == "append" and exists:
+                    for_append = pd.read_xml(self.url)
                     df = append_into([for_append, df])
 
-                df.to_xml(
-                    self.file_io,
-                    index=False,
-                    **kwargs,
-                )
-                self.file_io.truncate()
-            with open(self.url, "wb") as write_file:
-                self.file_io.seek(0)
-                write_file.write(self.file_io.getbuffer())
+                with replacing_file(self.url) as temp_path:
+                    df.to_xml(
+                        temp_path,
+                        index=False,
+                        **kwargs,
+                    )
 
     def close(self) -> None:
-        self.file_io.close()
-        del el.io_files[self.url]
+        pass  # not required / read from disk
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Optional
+
+import els.io.cache as source_cache
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+    import els.config as ec
+    from els.path import FlowAtom
+
+# dataflows loaded by earlier incremental runs, kept next to the root config
+MANIFEST_NAME = ".els_manifest.json"
+
+
+def source_state(config: ec.Config) -> Optional[list[Any]]:
+    url = config.source.url
+    if url and config.source.url_scheme == "file" and os.path.isfile(url):
+        # the content, a file written again unchanged is not loaded again
+        size, _, digest = source_cache.file_digest(url)
+        return [size, digest]
+    # databases and dataframes are always loaded again
+    return None
+
+
+def target_state(url: Optional[str]) -> Optional[list[Any]]:
+    if url and os.path.isfile(url):
+        stat = os.stat(url)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+def config_hash(config: ec.Config) -> str:
+    dump = config.model_dump_json(exclude={"config_path", "execution"})
+    return hashlib.blake2b(dump.encode(), digest_size=16).hexdigest()
+
+
+def atom_key(config: ec.Config) -> str:
+    source, target = config.source, config.target
+    return json.dumps([source.url, source.table, target.url, target.table])
+
+
+# appends only load the dataflows that changed; other modes replace what is
+# in the target, all the dataflows writing it are loaded again if any changed
+def atom_scope(config: ec.Config) -> str:
+    target = config.target
+    if target.if_exists == "append":
+        return atom_key(config)
+    elif target.if_exists in ("replace_file", "replace_database"):
+        return json.dumps([target.url])
+    else:
+        return json.dumps([target.url, target.table])
+
+
+class Manifest:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.atoms: dict[str, dict[str, Any]] = {}
+        self.targets: dict[str, Optional[list[Any]]] = {}
+        if path.is_file():
+            with path.open() as file:
+                content = json.load(file)
+            self.atoms = content.get("atoms", {})
+            self.targets = content.get("targets", {})
+
+    def unchanged(self, config: ec.Config) -> bool:
+        loaded = self.atoms.get(atom_key(config))
+        target_url = str(config.target.url)
+        return (
+            loaded is not None
+            and loaded["source"] is not None
+            and loaded["source"] == source_state(config)
+            and loaded["config"] == config_hash(config)
+            # the target was not changed since it was loaded
+            and target_url in self.targets
+            and self.targets[target_url] == target_state(target_url)
+        )
+
+    def pending(
+        self, tt_flow_atoms: dict[str, list[FlowAtom]]
+    ) -> dict[str, list[FlowAtom]]:
+        changed: set[str] = set()
+        current: set[str] = set()
+        for atoms in tt_flow_atoms.values():
+            for atom in atoms:
+                current.add(atom_key(atom.config))
+                if not self.unchanged(atom.config):
+                    changed.add(atom_scope(atom.config))
+        # dataflows gone since they were loaded: their rows are only dropped
+        # by loading the rest of their scope again
+        for key in set(self.atoms) - current:
+            scope = self.atoms.pop(key).get("scope")
+            if scope is not None:
+                changed.add(scope)
+        res: dict[str, list[FlowAtom]] = {}
+        total = 0
+        for target_table, atoms in tt_flow_atoms.items():
+            total += len(atoms)
+            pending = [atom for atom in atoms if atom_scope(atom.config) in changed]
+            if pending:
+                res[target_table] = pending
+        loading = sum(len(atoms) for atoms in res.values())
+        logging.info(f"Incremental: {total - loading} of {total} dataflows unchanged")
+        return res
+
+    # once the targets are written
+    def record(self, configs: Iterable[ec.Config]) -> None:
+        target_urls = set()
+        for config in configs:
+            self.atoms[atom_key(config)] = dict(
+                source=source_state(config),
+                config=config_hash(config),
+                scope=atom_scope(config),
+            )
+            target_urls.add(str(config.target.url))
+        for url in target_urls:
+            self.targets[url] = target_state(url)
+
+    def save(self) -> None:
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with temp_path.open("w") as file:
+            json.dump(dict(atoms=self.atoms, targets=self.targets), file, indent=1)
+        os.replace(temp_path, self.path)
@@ -26,6 +26,7 @@ if TYPE_CHECKING:
     from collections.abc import Callable, Iterable, Mapping, MutableMapping
 
     import els.io.base as eio
+    from els.manifest import Manifest
 
 CONFIG_FILE_EXT = ".els.yml"
 FOLDER_CONFIG_FILE_STEM = "_"
@@ -760,8 +761,11 @@ class ConfigPath(HumanPathPropertiesMixin, NodeMixin):
         parent: Optional[ef.FlowNodeMixin],
         flow_atoms: Iterable[FlowAtom],
         execute_fn: Callable[[ec.Config], bool],
+        execution: Optional[ec.Execution] = None,
     ) -> None:
-        ingest_files = ef.ElsFlow(parent=parent, n_jobs=1)
+        execution = execution or ec.Execution()
+        n_jobs, backend = execution.level_jobs("files")
+        ingest_files = ef.ElsFlow(parent=parent, n_jobs=n_jobs, backend=backend)
         keys = itemgetter(0, 1)
         flow_atoms = sorted(
             flow_atoms,
@@ -776,7 +780,8 @@ class ConfigPath(HumanPathPropertiesMixin, NodeMixin):
                 url=url_container[0],
                 container_class=url_container[1],
             )
-            exe_flow = ef.ElsFlow(parent=file_wrapper, n_jobs=1)
+            n_jobs, backend = execution.level_jobs("tables")
+            exe_flow = ef.ElsFlow(parent=file_wrapper, n_jobs=n_jobs, backend=backend)
             for atom in atoms:
                 ef.ElsExecute(
                     parent=exe_flow,
@@ -803,15 +808,26 @@ class ConfigPath(HumanPathPropertiesMixin, NodeMixin):
                 )
         return res
 
-    def get_ingest_taskflow(self) -> ef.ElsFlow:
-        root_flow = ef.ElsFlow()
+    def get_ingest_taskflow(
+        self,
+        execution: Optional[ec.Execution] = None,
+        manifest: Optional[Manifest] = None,
+    ) -> ef.ElsFlow:
+        execution = execution or ec.Execution()
+        n_jobs, backend = execution.level_jobs("target_tables")
+        root_flow = ef.ElsFlow(n_jobs=n_jobs, backend=backend)
         tt_flow_atoms = self.target_table_flow_atoms
+        if manifest is not None:
+            tt_flow_atoms = manifest.pending(tt_flow_atoms)
         for target_table, flow_atoms in tt_flow_atoms.items():
             file_group_wrapper = ef.ElsTargetTableWrapper(
                 parent=root_flow, name=target_table
             )
             ConfigPath.apply_file_wrappers(
-                parent=file_group_wrapper, flow_atoms=flow_atoms, execute_fn=ee.ingest
+                parent=file_group_wrapper,
+                flow_atoms=flow_atoms,
+                execute_fn=ee.ingest,
+                execution=execution,
             )
         return root_flow
 
@@ -0,0 +1,638 @@
+import json
+import os
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+import yaml
+
+import els.core as el
+import els.flow as ef
+import els.io.base as eio
+import els.io.cache as source_cache
+from els.cli import TaskFlow, cache_prune, execute
+from els.io.xl import XLContainer
+
+
+def write_sources(count: int) -> pd.DataFrame:
+    dfs = []
+    for i in range(count):
+        df = pd.DataFrame(
+            dict(
+                id=[i * 2, i * 2 + 1],
+                name=[f"a{i}", f"b{i}"],
+            )
+        )
+        df.to_csv(f"source{i}.csv", index=False)
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def write_root_config(config: dict) -> None:
+    with open("__.els.yml", "w") as file:
+        yaml.dump(config, file)
+
+
+def read_target(table: str) -> pd.DataFrame:
+    engine = sa.create_engine("sqlite:///target.db")
+    with engine.connect() as con:
+        res = pd.read_sql(sa.text(f"select * from {table}"), con)
+    engine.dispose()
+    return res
+
+
+def test_parallel_flow_persists(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(4)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+            )
+        )
+    )
+    with TaskFlow(str(tmp_path), n_jobs=2) as taskflow:
+        taskflow.execute()
+
+    actual = read_target("combined")
+    assert expected.equals(actual)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        "thread",
+        "process",
+    ],
+)
+@pytest.mark.parametrize(
+    "level",
+    [
+        "target_tables",
+        "files",
+        "tables",
+    ],
+)
+def test_execution_config(tmp_path, backend, level, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(4)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+            ),
+            execution={level: dict(n_jobs=2, backend=backend)},
+        )
+    )
+    execute(str(tmp_path))
+
+    actual = read_target("combined")
+    assert expected.equals(actual)
+
+
+def test_execution_dependent_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(1)
+    # the second document reads the table written by the first
+    with open("chain.els.yml", "w") as file:
+        yaml.dump_all(
+            [
+                dict(
+                    source=dict(url="source0.csv"),
+                    target=dict(url="sqlite:///target.db", table="first"),
+                ),
+                dict(
+                    source=dict(url="sqlite:///target.db", table="first"),
+                    target=dict(url="sqlite:///target.db", table="second"),
+                ),
+            ],
+            file,
+        )
+    with TaskFlow("chain.els.yml", n_jobs=2) as taskflow:
+        taskflow.execute()
+
+    actual = read_target("second")
+    assert expected.equals(actual)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        "thread",
+        "process",
+    ],
+)
+def test_scheduled_groups_share_container(tmp_path, backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_sources(4)
+    # no target table: one target table group per source file
+    write_root_config(dict(target=dict(url="sqlite:///target.db")))
+    with TaskFlow(str(tmp_path), n_jobs=3, backend=backend) as taskflow:
+        taskflow.execute()
+
+    for i in range(4):
+        expected = pd.read_csv(f"source{i}.csv")
+        actual = read_target(f"source{i}")
+        assert expected.equals(actual)
+
+
+def test_executor_stats(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(4)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+            ),
+        )
+    )
+    with TaskFlow(str(tmp_path), n_jobs=2, backend="thread") as taskflow:
+        taskflow.execute()
+        assert taskflow.executor.tasks == 4
+        assert taskflow.executor.work_time > 0
+
+    actual = read_target("combined")
+    assert expected.equals(actual)
+
+
+def test_adaptive_jobs_ordered_by_cost(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(4)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+            ),
+        )
+    )
+    with TaskFlow(str(tmp_path), n_jobs=-1, backend="thread") as taskflow:
+        assert taskflow.taskflow.n_jobs >= 1
+        taskflow.execute()
+
+    # loaded in flow order whatever the extraction order
+    actual = read_target("combined")
+    assert expected.equals(actual)
+    timed = {table for _, table in el.source_durations}
+    assert {f"source{i}" for i in range(4)} <= timed
+
+
+def test_available_memory(tmp_path, monkeypatch):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemFree:  1024 kB\nMemAvailable:  4096 kB\n")
+    monkeypatch.setattr(ef, "MEMINFO", str(meminfo))
+    # reclaimable page cache counted, not only free pages
+    assert ef.available_memory() == 4096 * 1024
+
+
+@pytest.mark.parametrize(
+    "target",
+    [
+        dict(url="sqlite:///target.db", table="chunked"),
+        dict(url="chunked.csv"),
+    ],
+)
+@pytest.mark.filterwarnings("error::pandas.errors.SettingWithCopyWarning")
+def test_chunked_ingest(tmp_path, target, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame(dict(id=range(25), name=[f"n{i}" for i in range(25)]))
+    df.to_csv("source.csv", index=False)
+    with open("source.els.yml", "w") as file:
+        yaml.dump(
+            dict(
+                source=dict(url="source.csv", read_args=dict(chunksize=4)),
+                target=target,
+                transforms=[
+                    dict(filter=dict(filter="id % 2 == 0")),
+                    dict(add_columns=dict(flag="x")),
+                ],
+            ),
+            file,
+        )
+    execute("source.els.yml")
+
+    expected = df[df["id"] % 2 == 0].reset_index(drop=True)
+    expected["flag"] = "x"
+    if target["url"].endswith(".csv"):
+        actual = pd.read_csv("chunked.csv")
+    else:
+        actual = read_target("chunked")
+    assert expected.equals(actual)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_targets_released_by_group(tmp_path, n_jobs, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_sources(2)
+    write_root_config(dict(target=dict(url="sqlite:///target.db")))
+    with TaskFlow(str(tmp_path), n_jobs=n_jobs, backend="thread") as taskflow:
+        taskflow.execute()
+        # written once both groups are done, before cleanup
+        assert "sqlite:///target.db" not in el.df_containers
+        for i in range(2):
+            expected = pd.read_csv(f"source{i}.csv")
+            assert expected.equals(read_target(f"source{i}"))
+
+
+def test_source_released_after_last_read(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = write_sources(1)
+    # one target table per name, both read from the source
+    with open("split.els.yml", "w") as file:
+        yaml.dump(
+            dict(
+                source=dict(url="source0.csv"),
+                target=dict(url="sqlite:///target.db"),
+                transforms=[dict(split_on_column=dict(on_column="name"))],
+            ),
+            file,
+        )
+    with TaskFlow("split.els.yml") as taskflow:
+        assert len(taskflow.taskflow.executes) == 2
+        taskflow.execute()
+        assert not any(url.endswith("source0.csv") for url in el.df_containers)
+
+    for table in ("a0", "b0"):
+        expected = df[df["name"] == table].reset_index(drop=True)
+        assert expected.equals(read_target(table))
+
+
+@pytest.mark.parametrize(
+    "target",
+    [
+        dict(url="sqlite:///target.db", table="combined"),
+        dict(url="combined.csv", table="combined"),
+    ],
+)
+def test_memory_limit_spills(tmp_path, target, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(6)
+    write_root_config(dict(target=target, execution=dict(memory_limit=100)))
+    with TaskFlow(str(tmp_path)) as taskflow:
+        taskflow.execute()
+
+    if target["url"].endswith(".csv"):
+        actual = pd.read_csv("combined.csv")
+    else:
+        actual = read_target("combined")
+    assert expected.equals(actual)
+
+
+def test_source_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    cache_dir = source_cache.cache_dir(tmp_path)
+    expected = write_sources(2)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+                if_exists="replace",
+            ),
+            execution=dict(source_cache=True),
+        )
+    )
+    execute(str(tmp_path))
+    # kept out of the project tree
+    assert cache_dir.is_relative_to(tmp_path / "cache")
+    assert len(os.listdir(cache_dir)) > 0
+
+    hits = source_cache.hits
+    execute(str(tmp_path))
+    assert source_cache.hits > hits
+    assert expected.equals(read_target("combined"))
+
+    # entries others could have written are not loaded
+    os.chmod(cache_dir, 0o777)
+    hits = source_cache.hits
+    execute(str(tmp_path))
+    assert source_cache.hits == hits
+    os.chmod(cache_dir, 0o700)
+
+    cache_prune(str(tmp_path), max_size="0")
+    assert os.listdir(cache_dir) == []
+
+
+def test_source_cache_total(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(source_cache, "directory", cache_dir)
+    monkeypatch.setattr(source_cache, "totals", {})
+    scans = []
+    entries = source_cache.entries
+    monkeypatch.setattr(
+        source_cache, "entries", lambda path: scans.append(path) or entries(path)
+    )
+    df = pd.DataFrame(dict(a=range(100)))
+    for i in range(3):
+        source_cache.store(f"key{i}", df)
+    # the directory is measured by the first store only
+    assert len(scans) == 1
+    total = source_cache.totals[cache_dir]
+    assert total == sum(path.stat().st_size for path in cache_dir.glob("*.pickle"))
+
+    # pruned once over the limit
+    monkeypatch.setattr(source_cache, "max_bytes", total)
+    source_cache.store("key3", df)
+    assert len(scans) == 2
+    assert len(list(cache_dir.glob("*.pickle"))) == 3
+    assert source_cache.totals[cache_dir] == total
+
+
+@pytest.mark.parametrize("if_exists", ["append", "truncate", "replace"])
+def test_incremental(tmp_path, if_exists, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(2)
+    if if_exists == "truncate":
+        # truncate expects the target table to exist
+        engine = sa.create_engine("sqlite:///target.db")
+        expected.head(0).to_sql("combined", engine, index=False)
+        engine.dispose()
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+                if_exists=if_exists,
+            ),
+        )
+    )
+    with TaskFlow(str(tmp_path), incremental=True) as taskflow:
+        taskflow.execute()
+    assert expected.equals(read_target("combined"))
+
+    # unchanged: nothing loaded
+    with TaskFlow(str(tmp_path), incremental=True) as taskflow:
+        assert not taskflow.taskflow.executes
+        taskflow.execute()
+    assert expected.equals(read_target("combined"))
+
+    # a new source: appended alone, or the whole table loaded again
+    expected = write_sources(3)
+    with TaskFlow(str(tmp_path), incremental=True) as taskflow:
+        loading = len(taskflow.taskflow.executes)
+        taskflow.execute()
+    assert loading == (1 if if_exists == "append" else 3)
+    assert expected.equals(read_target("combined"))
+
+    # a source deleted: its rows are kept by appends, dropped otherwise
+    os.remove("source0.csv")
+    with TaskFlow(str(tmp_path), incremental=True) as taskflow:
+        loading = len(taskflow.taskflow.executes)
+        taskflow.execute()
+    assert loading == (0 if if_exists == "append" else 2)
+    if if_exists != "append":
+        expected = expected.iloc[2:].reset_index(drop=True)
+    assert expected.equals(read_target("combined"))
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_sources_read_once(tmp_path, backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(4)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+            ),
+        )
+    )
+    with TaskFlow(str(tmp_path), n_jobs=2, backend=backend) as taskflow:
+        taskflow.execute()
+        # build, consistency check and ingest share one read
+        reads = {table: count for (_, table), count in eio.table_reads.items()}
+        for i in range(4):
+            assert reads[f"source{i}"] == 1
+
+    assert expected.equals(read_target("combined"))
+
+
+def test_new_tables_extracted_in_workers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # more rows than a sample, one new table per source
+    dfs = [pd.DataFrame(dict(id=range(i, 500, 4))) for i in range(4)]
+    for i, df in enumerate(dfs):
+        df.to_csv(f"source{i}.csv", index=False)
+    write_root_config(dict(target=dict(url="sqlite:///target.db")))
+    detached = []
+    detach = ef.ElsFlow.detach
+
+    def spy(flow: ef.ElsFlow, execute: ef.ElsExecute) -> bool:
+        detached.append(detach(flow, execute))
+        return detached[-1]
+
+    monkeypatch.setattr(ef.ElsFlow, "detach", spy)
+    with TaskFlow(str(tmp_path), n_jobs=4, backend="process") as taskflow:
+        taskflow.execute()
+        # the builds only read samples, the sources are read by the workers
+        assert detached == [True] * 4
+        reads = {table: count for (_, table), count in eio.table_reads.items()}
+        assert reads == {f"source{i}": 1 for i in range(4)}
+
+    for i, df in enumerate(dfs):
+        assert df.equals(read_target(f"source{i}"))
+
+
+def test_target_schema_probe(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existing = write_sources(1)
+    engine = sa.create_engine("sqlite:///target.db")
+    existing.to_sql("combined", engine, index=False)
+    engine.dispose()
+    expected = pd.concat([existing, write_sources(2)], ignore_index=True)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+                if_exists="append",
+            ),
+        )
+    )
+    with TaskFlow(str(tmp_path)) as taskflow:
+        taskflow.execute()
+        # checked and appended from the column types, its rows are not read
+        reads = {table for _, table in eio.table_reads}
+        assert "combined" not in reads
+
+    assert expected.equals(read_target("combined"))
+
+
+@pytest.mark.parametrize("existing", [[], [None, 1]])
+def test_target_schema_nullable_int(tmp_path, monkeypatch, existing):
+    monkeypatch.chdir(tmp_path)
+    engine = sa.create_engine("sqlite:///target.db")
+    with engine.begin() as con:
+        con.execute(sa.text("create table combined (id integer, name text)"))
+        for i, value in enumerate(existing):
+            con.execute(
+                sa.text("insert into combined values (:id, :name)"),
+                dict(id=value, name=f"e{i}"),
+            )
+    engine.dispose()
+    # a blank int value is read as float64
+    with open("source.csv", "w") as file:
+        file.write("id,name\n1,a\n,b\n")
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+                if_exists="append",
+            ),
+        )
+    )
+    execute(str(tmp_path))
+
+    actual = read_target("combined")
+    assert actual["name"].tolist() == [f"e{i}" for i in range(len(existing))] + [
+        "a",
+        "b",
+    ]
+
+
+def test_schema_registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = write_sources(2)
+    write_root_config(
+        dict(
+            target=dict(
+                url="sqlite:///target.db",
+                table="combined",
+                if_exists="append",
+            ),
+            execution=dict(schema_registry=True),
+        )
+    )
+    execute(str(tmp_path))
+    with open(".els_schemas.json") as file:
+        tables = json.load(file)
+    key = json.dumps(["sqlite:///target.db", "combined"])
+    assert tables[key]["columns"] == dict(id="int64", name="object")
+
+    # registered wrong: checked against the table again and registered anew
+    tables[key]["columns"]["id"] = "float64"
+    with open(".els_schemas.json", "w") as file:
+        json.dump(tables, file)
+    execute(str(tmp_path))
+    with open(".els_schemas.json") as file:
+        # the probe reports the nullable integer column as object
+        assert json.load(file)[key]["columns"]["id"] == "object"
+
+    with TaskFlow(str(tmp_path), refresh_schema=True) as taskflow:
+        taskflow.execute()
+
+    expected = pd.concat([df, df, df], ignore_index=True)
+    assert expected.equals(read_target("combined"))
+
+
+@pytest.mark.parametrize("url", ["sqlite:///target.db", "target.xlsx", "target.csv"])
+def test_cache_limit_new_target(tmp_path, monkeypatch, url):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(1)
+    write_root_config(
+        dict(
+            target=dict(url=url, table="combined"),
+            execution=dict(cache_limit="1MB"),
+        )
+    )
+    execute(str(tmp_path))
+
+    if url.startswith("sqlite"):
+        actual = read_target("combined")
+    elif url.endswith(".xlsx"):
+        actual = pd.read_excel(url, sheet_name="combined")
+    else:
+        actual = pd.read_csv(url)
+    assert expected.equals(actual)
+
+
+def test_xl_sheets_spliced(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = write_sources(1)
+    other = pd.DataFrame(dict(a=range(1000)))
+    other.to_excel("target.xlsx", sheet_name="other", index=False)
+    with zipfile.ZipFile("target.xlsx") as file:
+        before = file.getinfo("xl/worksheets/sheet1.xml")
+    with open("source.els.yml", "w") as file:
+        yaml.dump(
+            dict(source=dict(url="source0.csv"), target=dict(url="target.xlsx")),
+            file,
+        )
+    execute("source.els.yml")
+
+    # the sheet added is spliced in, the other one copied as it was
+    with zipfile.ZipFile("target.xlsx") as file:
+        after = file.getinfo("xl/worksheets/sheet1.xml")
+    assert (after.CRC, after.compress_size) == (before.CRC, before.compress_size)
+    assert other.equals(pd.read_excel("target.xlsx", sheet_name="other"))
+    assert expected.equals(pd.read_excel("target.xlsx", sheet_name="source0"))
+
+
+def test_xl_sheet_names_folded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existing = pd.DataFrame(dict(a=range(3)))
+    existing.to_excel("target.xlsx", sheet_name="Data", index=False)
+    df = pd.DataFrame(dict(b=range(2)))
+    df.to_csv("data.csv", index=False)
+    with open("source.els.yml", "w") as file:
+        yaml.dump(
+            dict(source=dict(url="data.csv"), target=dict(url="target.xlsx")),
+            file,
+        )
+    execute("source.els.yml")
+
+    # names equal but for case are one sheet to Excel: left to openpyxl,
+    # which renames the sheet added
+    sheets = pd.read_excel("target.xlsx", sheet_name=None)
+    assert list(sheets) == ["Data", "data1"]
+    assert existing.equals(sheets["Data"])
+    assert df.equals(sheets["data1"])
+
+
+def test_xl_rows_streamed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame(dict(id=range(1500), name=[f"n{i}" for i in range(1500)]))
+    df.loc[1499, "name"] = "a name longer than the sampled ones"
+    df.to_csv("source.csv", index=False)
+    with open("source.els.yml", "w") as file:
+        yaml.dump(
+            dict(source=dict(url="source.csv"), target=dict(url="target.xlsx")),
+            file,
+        )
+    execute("source.els.yml")
+
+    # written in constant memory: strings inline rather than shared
+    with zipfile.ZipFile("target.xlsx") as file:
+        assert "xl/sharedStrings.xml" not in file.namelist()
+        sheet = file.read("xl/worksheets/sheet1.xml").decode()
+    # sized from the first rows
+    assert '<col min="2" max="2" width="6"' in sheet
+    assert df.equals(pd.read_excel("target.xlsx", sheet_name="source"))
+
+
+def test_xl_timedelta_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame(dict(a=[1, 2], t=pd.to_timedelta(["1 days 06:00:00", None])))
+    df.to_excel("expected.xlsx", sheet_name="td", index=False)
+    pd.DataFrame(dict(a=[1])).to_excel("spliced.xlsx", sheet_name="other", index=False)
+    # streamed into a new workbook, spliced into an existing one
+    for url, replace in (("streamed.xlsx", True), ("spliced.xlsx", False)):
+        container = XLContainer(url, replace=replace)
+        container.fetch_child("td", df)
+        container.write()
+        container.close()
+
+    # in days, with the number format pandas gives them
+    def cells(url: str) -> list[tuple]:
+        sheet = openpyxl.load_workbook(url)["td"]
+        return [(cell.value, cell.number_format) for cell in sheet["B"]]
+
+    assert cells("streamed.xlsx") == cells("expected.xlsx")
+    assert cells("spliced.xlsx") == cells("expected.xlsx")
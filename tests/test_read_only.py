@@ -1,9 +1,13 @@
+import io
 import os
 
 import pandas as pd
 
 import els.config as ec
 import els.core as el
+import els.io.base as eio
+from els.io.csv import BoundedReader, CSVContainer, footer_offset
+from els.io.xl import NA_STRINGS, XLContainer, grid_frame
 
 from . import helpers as th
 
@@ -109,3 +113,132 @@ def test_pdf_read(pytester) -> None:
     # inbound["pdf1"]["font_color"] = inbound["pdf1"]["font_color"].replace("0", "")
     inbound["pdf1"].drop("font_color", axis=1, inplace=True)
     th.assert_expected(expected, inbound["pdf1"])
+
+
+def test_cache_limit_evicts_read_sources(pytester) -> None:
+    for i in range(3):
+        pd.DataFrame(dict(a=range(100))).to_csv(f"source{i}.csv", index=False)
+    evictions = el.df_containers.evictions
+    el.set_cache_limit(1)
+    try:
+        for i in range(3):
+            container = el.fetch_df_container(CSVContainer, f"source{i}.csv")
+            container[f"source{i}"].read(dict(sep=","))
+        # only the container fetched last is kept
+        assert list(el.df_containers) == ["source2.csv"]
+        assert el.df_containers.evictions == evictions + 2
+    finally:
+        el.set_cache_limit(None)
+        el.evict_df_container("source2.csv")
+
+
+def test_xl_sheet_decoded_once(pytester, monkeypatch) -> None:
+    monkeypatch.setattr(eio, "nrows_for_sampling", 100)
+    df = pd.DataFrame(dict(a=range(200), b=[f"n{i}" for i in range(200)]))
+    with pd.ExcelWriter("source.xlsx") as writer:
+        for sheet_name in ("first", "second"):
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    container = XLContainer("source.xlsx")
+    # found from the workbook metadata
+    assert container.child_names == ["first", "second"]
+    assert not container.grids
+
+    assert list(container.schema("first", {}).columns) == ["a", "b"]
+    assert df.head(100).equals(container["first"].read({}, sample=True))
+    # the schema and the sample share the sheet's grid, the other sheet is
+    # not decoded
+    assert list(container.grids) == ["first"]
+    assert df.head(199).equals(container["first"].read(dict(skipfooter=1)))
+    # let go once the frame is read whole
+    assert not container.grids
+    container.close()
+
+
+def test_xl_grid_frame(pytester) -> None:
+    df = pd.DataFrame(
+        dict(
+            a=[1, 2, 3, 4],
+            b=[1.5, 2.0, None, 4.0],
+            c=["x", None, "z", "w"],
+            d=[True, False, True, True],
+            e=pd.to_datetime(["2020-01-01", "2021-02-03", None, "2022-01-01"]),
+        )
+    )
+    df.to_excel("source.xlsx", index=False)
+    grid = XLContainer("source.xlsx").grid("Sheet1")
+    for kwargs in (
+        {},
+        dict(nrows=2),
+        dict(skipfooter=1),
+        dict(usecols=[0, 2]),
+        dict(usecols=["c", "a"]),
+        dict(names=list("ABCDE")),
+    ):
+        expected = pd.read_excel("source.xlsx", engine="calamine", **kwargs)
+        pd.testing.assert_frame_equal(grid_frame(grid, kwargs), expected)
+    # headers not given as text and cells read_excel converts are left to it
+    assert grid_frame(grid, dict(header=None)) is None
+    assert grid_frame([["n"], ["NA"], ["1"]], {}) is None
+
+    # the strings left to read_excel are the ones it reads as missing
+    na_strings = sorted(NA_STRINGS - {""})
+    pd.DataFrame(dict(n=na_strings)).to_excel("na.xlsx", index=False)
+    assert pd.read_excel("na.xlsx", engine="calamine")["n"].isna().all()
+
+
+def test_xl_sheet_height(pytester) -> None:
+    pd.DataFrame(dict(a=range(3))).to_excel(
+        "source.xlsx", index=False, startrow=3, startcol=2
+    )
+    container = XLContainer("source.xlsx")
+    # the rows appended to follow, found without decoding the sheet
+    assert container.sheet_height("Sheet1") == 7
+    assert "Sheet1" not in container.grids
+    assert len(container.grid("Sheet1")) == 7
+    container.close()
+
+
+def test_csv_footer_trimmed(pytester) -> None:
+    with open("source.csv", "w") as file:
+        file.write("a,b\n1,x\n2,y\ntotal,2\nend,\n")
+    with open("quoted.csv", "w") as file:
+        file.write('a,b\n1,x\n2,y\n"total, all",2\nend,\n')
+    for url in ("source.csv", "quoted.csv"):
+        expected = pd.read_csv(url, skipfooter=2, engine="python")
+        container = CSVContainer(url)
+        df = container[url[:-4]].read(dict(skipfooter=2, capture_footer=True))
+        assert df.drop(columns="_footer").equals(expected)
+        assert df["_footer"].iloc[0] == str(
+            [["total, all" if url == "quoted.csv" else "total", "2"], ["end", ""]]
+        )
+        container.close()
+
+    with el.open_source("source.csv") as csv_io:
+        # the footer starts after the rows, it is cut off for the C engine
+        assert footer_offset(csv_io, 2) == len("a,b\n1,x\n2,y\n")
+        # and read from the file as it is, up to the footer
+        body = io.BufferedReader(BoundedReader(csv_io, footer_offset(csv_io, 2)))
+        assert body.read() == b"a,b\n1,x\n2,y\n"
+    with el.open_source("quoted.csv") as csv_io:
+        assert footer_offset(csv_io, 2) is None
+
+
+def test_registry_sizes_kept() -> None:
+    measured = []
+
+    def size_of(value: int) -> int:
+        measured.append(value)
+        return value
+
+    registry: el.Registry[int] = el.Registry(
+        size_of=size_of, is_clean=lambda url, value: True, close=lambda value: None
+    )
+    registry.max_bytes = 10
+    for i in range(5):
+        registry.add(f"url{i}", 4)
+    # each entry measured once, when added, with a running total
+    assert measured == [4] * 5
+    assert list(registry) == ["url3", "url4"]
+    assert registry.nbytes == 8
+    registry.pop("url3")
+    assert registry.nbytes == 4